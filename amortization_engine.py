@@ -5,10 +5,19 @@ import json
 import math
 import io
 import base64
-from typing import Dict, List, Any, Tuple
+import time
+from itertools import zip_longest
+from typing import Dict, List, Any, Tuple, Iterable, Iterator, Optional
+import numpy as np
 import pandas as pd
 import xlsxwriter
 
+from chart_series import merge_balance_series, downsample_series
+from frequency_engine import (
+    PERIODS_PER_YEAR, amortize_periodic, contributions_per_month, normalize_frequency, parse_start_date
+)
+from rate_curves import curve_plan, normalize_curve_spec
+
 # -----------------------
 # Helpers
 # -----------------------
@@ -40,6 +49,66 @@ def _base_payment_for(balance: float, r_month: float, months_remaining: int) ->
     else:
         return balance / months_remaining
 
+# Simulated loan-months one optimizer request may spend (~1.5us each), keeping it well under a second
+_OPTIMIZER_MONTH_BUDGET = 250_000
+
+# Below half a cent the loan counts as repaid: a float residual is not recast into extra rows
+_PAID_OFF_BALANCE = 0.005
+
+def _rate_curve_schedule(rate_curve: Optional[Dict[str, Any]], annual_rate_pct: float, months_total: int,
+                         offset: int = 0) -> Tuple[float, Dict[int, Tuple[float, float]]]:
+    """Opening annual % and {month: (monthly rate, annuity factor)} resets; no curve means no resets."""
+    if not rate_curve:
+        return float(annual_rate_pct), {}
+    plan = curve_plan(rate_curve, annual_rate_pct, months_total, offset)
+    return plan.opening_rate_pct, plan.resets
+
+# Inputs that _iter_flexible can differentiate total interest, payoff month and balance against.
+# 'rate' is a parallel shift of every rate in the schedule, per percentage point.
+SENSITIVITY_PARAMS = ("rate", "monthly_overpay", "annual_lump", "one_off_lump", "principal")
+
+def _annuity_factor_slope(r_month: float, months_remaining: int) -> Tuple[float, float]:
+    """Annuity factor a(r, n) (payment per unit balance) and its derivative da/dr."""
+    n = max(1, int(months_remaining))
+    if r_month == 0:
+        return 1.0 / n, (n + 1) / (2.0 * n)
+    disc = (1 + r_month) ** -n
+    denom = 1 - disc
+    return r_month / denom, (denom - r_month * n * disc / (1 + r_month)) / denom ** 2
+
+def _rate_shift_weight(rate_curve: Optional[Dict[str, Any]], annual_pct: float) -> float:
+    """How much of a parallel rate shift reaches a curve-driven rate: none while a cap or floor binds."""
+    if rate_curve:
+        for bound in (rate_curve.get('cap'), rate_curve.get('floor')):
+            if bound is not None and abs(annual_pct - bound) < 1e-9:
+                return 0.0
+    return 1.0
+
+def _sensitivity_report(d_interest: np.ndarray, d_payoff: np.ndarray, d_balance: np.ndarray, at_month: int) -> Dict[str, Any]:
+    def per_param(d):
+        return {name: round(float(v), 4) for name, v in zip(SENSITIVITY_PARAMS, d)}
+    return {
+        'total_interest': per_param(d_interest),
+        'payoff_month': per_param(d_payoff),
+        'balance_at_month': per_param(d_balance),
+        'at_month': at_month
+    }
+
+def _sensitivity_option(data: Dict[str, Any]) -> Optional[int]:
+    """Month for balance_at_month partials ('sensitivity_month', default 60) when 'sensitivities' is requested, else None."""
+    if not data.get('sensitivities'):
+        return None
+    try:
+        return max(1, int(data.get('sensitivity_month') or 60))
+    except:
+        return 60
+
+def _sensitivity_kwargs(boxes: Optional[Dict[str, Dict[str, Any]]], name: str, at_month: Optional[int]) -> Dict[str, Any]:
+    """Extra _amortize_flexible arguments that fill boxes[name]; nothing when sensitivities are off."""
+    if boxes is None:
+        return {}
+    return {"sensitivities": boxes.setdefault(name, {}), "sensitivity_month": at_month}
+
 def _generate_yearly_schedule_from_capitalized(hist: List[Dict[str, Any]], initial_principal: float) -> List[Dict[str, Any]]:
     if not hist:
         return [{"year": 0, "payment": 0.0, "principal": 0.0, "interest": 0.0, "balance": round(initial_principal, 2)}]
@@ -77,51 +146,166 @@ def _generate_yearly_schedule_from_normalized(monthly_norm: List[Dict[str, Any]]
     ).reset_index().rename(columns={'Year': 'year'})
     return agg.round(2).to_dict('records')
 
-def _generate_chart_data(base_hist: List[Dict[str, Any]], over_hist: List[Dict[str, Any]], principal: float) -> List[Dict[str, Any]]:
-    max_months = max(len(base_hist), len(over_hist))
-    chart_data: List[Dict[str, Any]] = []
-    base_balances = {h['Month']: h['Balance'] for h in base_hist}
-    over_balances = {h['Month']: h['Balance'] for h in over_hist}
-    for month in range(0, max_months + 1, 6):
-        if month == 0:
-            base_balance = over_balance = principal
-        else:
-            base_balance = base_balances.get(month, base_balances.get(month-1, 0.0))
-            over_balance = over_balances.get(month, over_balances.get(month-1, 0.0))
-            if month > len(base_hist): base_balance = 0.0
-            if month > len(over_hist): over_balance = 0.0
-        chart_data.append({
-            "month": month,
-            "baseline_balance": round(base_balance, 2),
-            "overpay_balance": round(over_balance, 2),
-        })
-    return chart_data
+def _generate_chart_data(base_hist: List[Dict[str, Any]], over_hist: List[Dict[str, Any]], principal: float,
+                         max_points: Optional[int] = None, keep_months: Iterable[int] = ()) -> List[Dict[str, Any]]:
+    """
+    Without `max_points` both balances are sampled every 6 months. With it, every month is
+    downsampled with LTTB to about that many points, keeping month 0, each payoff month
+    and `keep_months` (e.g. rate changes) exact.
+    """
+    if not max_points:
+        return list(_iter_chart_samples(base_hist, over_hist, principal))
+    months, columns = merge_balance_series({"baseline_balance": base_hist, "overpay_balance": over_hist})
+    # Month 0 is the opening balance; a series reads 0.0 once it has paid off
+    months = [0] + months
+    for name, col in columns.items():
+        columns[name] = [principal] + [0.0 if b is None else b for b in col]
+    anchors = {len(base_hist), len(over_hist), *keep_months}
+    return downsample_series(months, columns, max_points, anchors)
 
-def _normalize_monthly_history(hist: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    normalized: List[Dict[str, Any]] = []
-    for h in hist:
-        month = h.get('month', h.get('Month', 0))
-        payment = h.get('payment', h.get('Payment', 0.0))
-        principal = h.get('principal', h.get('Principal', 0.0))
-        interest = h.get('interest', h.get('Interest', 0.0))
-        balance = h.get('balance', h.get('Balance', 0.0))
+def _chart_points_option(data: Dict[str, Any]) -> Optional[int]:
+    """Client-requested chart point budget ('chart_points'), or None for the default sampling."""
+    try:
+        n = int(data.get('chart_points') or 0)
+    except:
+        return None
+    return max(3, n) if n > 0 else None
+
+def _chart_point(month: int, base_balance: float, over_balance: float) -> Dict[str, Any]:
+    return {
+        "month": month,
+        "baseline_balance": round(base_balance, 2),
+        "overpay_balance": round(over_balance, 2),
+    }
+
+def _iter_chart_samples(base_rows: Iterable[Dict[str, Any]], over_rows: Iterable[Dict[str, Any]],
+                        principal: float, step: int = 6) -> Iterator[Dict[str, Any]]:
+    """Samples both balance series every `step` months in a single lockstep pass.
+    A series that has already paid off reads as 0.0."""
+    yield _chart_point(0, principal, principal)
+    month = 0
+    for base_row, over_row in zip_longest(base_rows, over_rows):
+        month += 1
+        if month % step == 0:
+            yield _chart_point(
+                month,
+                base_row['Balance'] if base_row is not None else 0.0,
+                over_row['Balance'] if over_row is not None else 0.0,
+            )
+
+def _normalize_monthly_row(h: Dict[str, Any]) -> Dict[str, Any]:
+    month = h.get('month', h.get('Month', 0))
+    payment = h.get('payment', h.get('Payment', 0.0))
+    principal = h.get('principal', h.get('Principal', 0.0))
+    interest = h.get('interest', h.get('Interest', 0.0))
+    balance = h.get('balance', h.get('Balance', 0.0))
+    try:
+        month_i = int(month)
+    except:
+        month_i = 0
+    def tof(x):
         try:
-            month_i = int(month)
+            return float(x)
         except:
-            month_i = 0
-        def tof(x):
-            try:
-                return float(x)
-            except:
-                return 0.0
-        normalized.append({
-            "month": month_i,
-            "payment": round(tof(payment), 2),
-            "principal": round(tof(principal), 2),
-            "interest": round(tof(interest), 2),
-            "balance": round(tof(balance), 2)
-        })
-    return normalized
+            return 0.0
+    return {
+        "month": month_i,
+        "payment": round(tof(payment), 2),
+        "principal": round(tof(principal), 2),
+        "interest": round(tof(interest), 2),
+        "balance": round(tof(balance), 2)
+    }
+
+def _normalize_monthly_history(hist: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [_normalize_monthly_row(h) for h in hist]
+
+# -----------------------
+# Streaming helpers
+# -----------------------
+
+class _YearlyRollup:
+    """One-pass yearly aggregation over capitalized monthly rows.
+    Mirrors _generate_yearly_schedule_from_capitalized without holding the history."""
+
+    def __init__(self):
+        self.year = None
+        self.payment = self.principal = self.interest = self.balance = 0.0
+
+    def add(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Adds a month; returns the previous year's totals when a new year starts."""
+        year = (int(row["Month"]) - 1) // 12 + 1
+        closed = None
+        if self.year is not None and year != self.year:
+            closed = self.flush()
+        if self.year is None:
+            self.year = year
+        self.payment += row["Payment"]
+        self.principal += row["Principal"]
+        self.interest += row["Interest"]
+        self.balance = row["Balance"]
+        return closed
+
+    def flush(self) -> Optional[Dict[str, Any]]:
+        if self.year is None:
+            return None
+        out = {
+            "year": self.year,
+            "payment": round(self.payment, 2),
+            "principal": round(self.principal, 2),
+            "interest": round(self.interest, 2),
+            "balance": round(self.balance, 2)
+        }
+        self.__init__()
+        return out
+
+def _capture_result(gen: Iterator[Dict[str, Any]], box: List[Any]) -> Iterator[Dict[str, Any]]:
+    """Re-yields `gen` and appends its return value to `box` once exhausted."""
+    box.append((yield from gen))
+
+def _stream_schedule(base_rows: Iterable[Dict[str, Any]], over_rows: Iterable[Dict[str, Any]],
+                     principal: float, chunk_size: int = 12, chart_step: int = 6):
+    """
+    Walks the baseline and overpay streams in lockstep and yields NDJSON records:
+    'monthly' chunks and 'yearly' rows for the overpay series, plus 'chart' points.
+    Returns the interest/month totals of both series.
+    """
+    chunk_size = max(1, int(chunk_size))
+    totals = {"base_interest": 0.0, "base_months": 0, "over_interest": 0.0, "over_months": 0}
+    rollup = _YearlyRollup()
+    chunk: List[Dict[str, Any]] = []
+
+    yield {"type": "yearly", "row": {"year": 0, "payment": 0.0, "principal": 0.0, "interest": 0.0, "balance": round(principal, 2)}}
+    yield {"type": "chart", "point": _chart_point(0, principal, principal)}
+
+    month = 0
+    for base_row, over_row in zip_longest(base_rows, over_rows):
+        month += 1
+        if base_row is not None:
+            totals["base_interest"] += base_row["Interest"]
+            totals["base_months"] += 1
+        if over_row is not None:
+            totals["over_interest"] += over_row["Interest"]
+            totals["over_months"] += 1
+            chunk.append(_normalize_monthly_row(over_row))
+            if len(chunk) >= chunk_size:
+                yield {"type": "monthly", "rows": chunk}
+                chunk = []
+            closed = rollup.add(over_row)
+            if closed:
+                yield {"type": "yearly", "row": closed}
+        if month % chart_step == 0:
+            yield {"type": "chart", "point": _chart_point(
+                month,
+                base_row['Balance'] if base_row is not None else 0.0,
+                over_row['Balance'] if over_row is not None else 0.0,
+            )}
+
+    if chunk:
+        yield {"type": "monthly", "rows": chunk}
+    closed = rollup.flush()
+    if closed:
+        yield {"type": "yearly", "row": closed}
+    return totals
 
 # -----------------------
 # Core Engine
@@ -141,29 +325,96 @@ class AmortizationEngine:
         one_off_lump: float = 0.0,
         one_off_lump_month: int = 0,
         # rate changes
-        rate_changes: Dict[int, float] = None
+        rate_changes: Dict[int, float] = None,
+        # index-linked rate curve (see rate_curves.py); month 1 is curve month offset + 1
+        rate_curve: Dict[str, Any] = None,
+        rate_curve_offset: int = 0,
+        # pass a dict to have it filled with partial derivatives (see _iter_flexible)
+        sensitivities: Dict[str, Any] = None,
+        sensitivity_month: int = 60
     ) -> Tuple[List[Dict[str, Any]], float]:
-        
+        history = list(self._iter_flexible(
+            principal, annual_rate_pct, years,
+            monthly_overpay=monthly_overpay, overpay_pct_of_base=overpay_pct_of_base,
+            annual_lump=annual_lump, annual_lump_month=annual_lump_month,
+            one_off_lump=one_off_lump, one_off_lump_month=one_off_lump_month,
+            rate_changes=rate_changes, rate_curve=rate_curve, rate_curve_offset=rate_curve_offset,
+            sensitivities=sensitivities, sensitivity_month=sensitivity_month
+        ))
+        months_total = max(1, int(years * 12))
+        opening_rate, _ = _rate_curve_schedule(rate_curve, annual_rate_pct, months_total, rate_curve_offset)
+        first_base_payment = _base_payment_for(float(principal), opening_rate / 100.0 / 12.0, months_total)
+        return history, first_base_payment
+
+    def _iter_flexible(
+        self,
+        principal: float,
+        annual_rate_pct: float,
+        years: int,
+        monthly_overpay: float = 0.0,
+        overpay_pct_of_base: float = 0.0,
+        annual_lump: float = 0.0,
+        annual_lump_month: int = 12,
+        one_off_lump: float = 0.0,
+        one_off_lump_month: int = 0,
+        rate_changes: Dict[int, float] = None,
+        rate_curve: Dict[str, Any] = None,
+        rate_curve_offset: int = 0,
+        sensitivities: Dict[str, Any] = None,
+        sensitivity_month: int = 60
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily yields the capitalized monthly rows of _amortize_flexible.
+        Explicit rate_changes win over a rate curve reset in the same month.
+
+        If `sensitivities` is a dict, forward-mode derivatives (one tangent per
+        SENSITIVITY_PARAMS entry) are carried through the same recurrence, and once the
+        schedule is exhausted the dict is filled with the partials of total interest,
+        payoff month (continuous: the final month counts as the fraction of a full payment
+        it needed) and the balance at `sensitivity_month`.
+        """
         if rate_changes is None:
             rate_changes = {}
 
         months_total = max(1, int(years * 12))
         balance = float(principal)
-        r_annual = float(annual_rate_pct)
+        r_annual, resets = _rate_curve_schedule(rate_curve, annual_rate_pct, months_total, rate_curve_offset)
         r = r_annual / 100.0 / 12.0
 
         base_payment = _base_payment_for(balance, r, months_total)
-        first_base_payment = base_payment
-        history: List[Dict[str, Any]] = []
+
+        tangent = sensitivities is not None
+        if tangent:
+            unit = np.eye(len(SENSITIVITY_PARAMS))
+            d_r = unit[0] * _rate_shift_weight(rate_curve, r_annual) / 1200.0
+            d_balance = unit[4].copy()
+            a, da = _annuity_factor_slope(r, months_total)
+            d_base = d_balance * a + balance * da * d_r
+            d_interest_total = np.zeros(len(SENSITIVITY_PARAMS))
+            d_payoff = np.zeros(len(SENSITIVITY_PARAMS))
+            d_balance_at = None
 
         for m in range(1, months_total + 20*12): # Add 20 extra years as a buffer
             if balance <= 0:
                 break
+            if balance < _PAID_OFF_BALANCE and (m in rate_changes or m in resets):
+                break
 
             if m in rate_changes:
                 r_annual = float(rate_changes[m])
                 r = r_annual / 100.0 / 12.0
                 base_payment = _base_payment_for(balance, r, months_total - m + 1)
+                if tangent:
+                    d_r = unit[0] / 1200.0
+                    a, da = _annuity_factor_slope(r, months_total - m + 1)
+                    d_base = d_balance * a + balance * da * d_r
+            elif m in resets:
+                r, factor = resets[m]
+                base_payment = balance * factor
+                if tangent:
+                    d_r = unit[0] * _rate_shift_weight(rate_curve, r * 1200.0) / 1200.0
+                    _, da = _annuity_factor_slope(r, months_total - m + 1)
+                    d_base = d_balance * factor + balance * da * d_r
 
             base_now = base_payment
             extra = 0.0
@@ -177,6 +428,17 @@ class AmortizationEngine:
             interest = balance * r
             actual_payment = base_now + extra
 
+            if tangent:
+                d_interest = d_balance * r + balance * d_r
+                d_payment = d_base * (1.0 + float(overpay_pct_of_base) / 100.0) + unit[1]
+                # Lumps count at their month even when zero: the marginal value of adding one
+                if int(((m - 1) % 12) + 1) == int(annual_lump_month):
+                    d_payment = d_payment + unit[2]
+                if int(m) == int(one_off_lump_month):
+                    d_payment = d_payment + unit[3]
+                d_interest_total += d_interest
+                owed, scheduled = balance + interest, actual_payment
+
             if balance + interest < actual_payment:
                 actual_payment = balance + interest
                 principal_paid = balance
@@ -185,24 +447,175 @@ class AmortizationEngine:
                 principal_paid = actual_payment - interest
                 balance = max(0.0, balance - principal_paid)
 
-            history.append({
+            if tangent:
+                if balance <= 0:
+                    # payoff month m - 1 + owed / scheduled
+                    d_payoff = ((d_balance + d_interest) * scheduled - owed * d_payment) / scheduled ** 2
+                    d_balance = np.zeros(len(SENSITIVITY_PARAMS))
+                else:
+                    d_balance = d_balance + d_interest - d_payment
+                if m == sensitivity_month:
+                    d_balance_at = d_balance
+
+            yield {
                 "Month": m,
                 "Payment": round(actual_payment, 2),
                 "Principal": round(principal_paid, 2),
                 "Interest": round(interest, 2),
                 "Balance": round(balance, 2)
-            })
+            }
             if balance <= 0:
                 break
-        
-        return history, first_base_payment
+
+        if tangent:
+            if d_balance_at is None:
+                d_balance_at = d_balance
+            sensitivities.update(_sensitivity_report(d_interest_total, d_payoff, d_balance_at, int(sensitivity_month)))
+
+    def _amortize_totals(
+        self,
+        principal: float,
+        annual_rate_pct: float,
+        years: int,
+        monthly_overpay: float = 0.0,
+        overpay_pct_of_base: float = 0.0,
+        annual_lump: float = 0.0,
+        annual_lump_month: int = 12,
+        one_off_lump: float = 0.0,
+        one_off_lump_month: int = 0,
+        rate_changes: Dict[int, float] = None,
+        rate_curve: Dict[str, Any] = None,
+        rate_curve_offset: int = 0,
+        frontier: List[Tuple[float, int]] = None,
+        pct_spend_limit: float = None
+    ) -> Any:
+        """
+        Summary-only twin of _iter_flexible: same recurrence, no rows.
+        Returns (total_interest, months) with interest summed from the rounded monthly
+        figures like the summary routes do. If `frontier` is given, the run is abandoned
+        (None) once a known (interest, months) point is guaranteed to dominate it.
+        If `pct_spend_limit` is given, the run is rejected (False) as soon as the
+        overpay_pct_of_base channel spends more than that within one loan year, which
+        happens once a rate rise lifts the base payment it is a percentage of.
+        """
+        if rate_changes is None:
+            rate_changes = {}
+
+        months_total = max(1, int(years * 12))
+        balance = float(principal)
+        r_annual, resets = _rate_curve_schedule(rate_curve, annual_rate_pct, months_total, rate_curve_offset)
+        r = r_annual / 100.0 / 12.0
+        base_payment = _base_payment_for(balance, r, months_total)
+        pct = float(overpay_pct_of_base) / 100.0
+        monthly_overpay = float(monthly_overpay)
+        lump_month = int(annual_lump_month) if annual_lump else -1
+        one_off_month = int(one_off_lump_month) if one_off_lump else -1
+
+        total_interest = 0.0
+        pct_spent = 0.0
+        m = 0
+        for m in range(1, months_total + 20*12):
+            if balance < _PAID_OFF_BALANCE and (m in rate_changes or m in resets):
+                return total_interest, m - 1
+            if m in rate_changes:
+                r = float(rate_changes[m]) / 100.0 / 12.0
+                base_payment = _base_payment_for(balance, r, months_total - m + 1)
+            elif m in resets:
+                r, factor = resets[m]
+                base_payment = balance * factor
+
+            extra = monthly_overpay + base_payment * pct
+            if pct_spend_limit is not None and pct:
+                pct_spent = base_payment * pct + (pct_spent if (m - 1) % 12 else 0.0)
+                if pct_spent > pct_spend_limit + 0.01:
+                    return False
+            if (m - 1) % 12 + 1 == lump_month:
+                extra += float(annual_lump)
+            if m == one_off_month:
+                extra += float(one_off_lump)
+            actual_payment = base_payment + extra
+
+            interest = balance * r
+            total_interest += round(interest, 2)
+            if balance + interest < actual_payment:
+                return total_interest, m
+            balance = max(0.0, balance - (actual_payment - interest))
+            if balance <= 0:
+                return total_interest, m
+
+            if frontier and m % 12 == 0:
+                for f_interest, f_months in frontier:
+                    if f_interest <= total_interest and f_months <= m:
+                        return None
+        return total_interest, m
+
+    def _amortize_periodic(
+        self,
+        frequency: str,
+        start_date,
+        principal: float,
+        annual_rate_pct: float,
+        years: int,
+        monthly_overpay: float = 0.0,
+        overpay_pct_of_base: float = 0.0,
+        annual_lump: float = 0.0,
+        annual_lump_month: int = 12,
+        one_off_lump: float = 0.0,
+        one_off_lump_month: int = 0,
+        rate_changes: Dict[int, float] = None,
+        rate_curve: Dict[str, Any] = None,
+        rate_curve_offset: int = 0
+    ) -> Tuple[List[Dict[str, Any]], float]:
+        """
+        _amortize_flexible for weekly / fortnightly payments or daily accrual (see frequency_engine.py).
+        Rows are the same capitalized monthly rows; the first base payment is its monthly equivalent.
+        """
+        months_total = max(1, int(years * 12))
+        month_rates: Dict[int, float] = {}
+        if rate_curve:
+            plan = curve_plan(rate_curve, annual_rate_pct, months_total, rate_curve_offset)
+            annual_rate_pct = plan.opening_rate_pct
+            month_rates.update((m, float(plan.path[m - 1])) for m in plan.resets)
+        month_rates.update(rate_changes or {})
+
+        res = amortize_periodic(
+            principal, annual_rate_pct, years, frequency,
+            monthly_overpay=monthly_overpay, overpay_pct_of_base=overpay_pct_of_base,
+            annual_lump=annual_lump, annual_lump_month=annual_lump_month,
+            one_off_lump=one_off_lump, one_off_lump_month=one_off_lump_month,
+            month_rates=month_rates, start_date=start_date
+        )
+        history = [
+            {"Month": m, "Payment": round(pay, 2), "Principal": round(prin, 2),
+             "Interest": round(intr, 2), "Balance": round(bal, 2)}
+            for m, pay, prin, intr, bal in zip(
+                res['month'].tolist(), res['payment'].tolist(), res['principal'].tolist(),
+                res['interest'].tolist(), res['balance'].tolist()
+            )
+        ]
+        return history, res['base_payment'] * PERIODS_PER_YEAR[frequency] / 12.0
+
+    def _amortize_for(self, p: Dict[str, Any], sensitivities: Dict[str, Any] = None, sensitivity_month: int = 60,
+                      **sim_inputs) -> Tuple[List[Dict[str, Any]], float]:
+        """
+        Runs the monthly engine or the periodic one, depending on the parsed payment_frequency.
+        Sensitivities are only computed by the monthly engine; the dict stays empty otherwise.
+        """
+        if p.get('payment_frequency', 'monthly') == 'monthly':
+            return self._amortize_flexible(sensitivities=sensitivities, sensitivity_month=sensitivity_month, **sim_inputs)
+        return self._amortize_periodic(p['payment_frequency'], p.get('start_date'), **sim_inputs)
 
     def _parse_mortgage_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Parses the 12-field input from Dart."""
+        """Parses the 12-field input from Dart (plus optional 'rate_curve', 'payment_frequency' and 'start_date')."""
+        annual_rate_pct = _normalize_rate_input(data.get('rate', 0.0))
+        years = int(data.get('years', 0))
+        rate_curve = normalize_curve_spec(data.get('rate_curve'))
+        if rate_curve:
+            annual_rate_pct, _ = _rate_curve_schedule(rate_curve, annual_rate_pct, max(1, years * 12))
         return {
             "principal": float(data.get('loan', 0.0)),
-            "annual_rate_pct": _normalize_rate_input(data.get('rate', 0.0)),
-            "years": int(data.get('years', 0)),
+            "annual_rate_pct": annual_rate_pct,
+            "years": years,
             "propval": float(data.get('value', 0.0)),
             "monthly_overpay": float(data.get('monthly_overpay', 0.0)),
             "overpay_pct_of_base": float(data.get('overpay_pct_of_base', 0.0)),
@@ -211,16 +624,14 @@ class AmortizationEngine:
             "one_off_lump": float(data.get('one_off_lump', 0.0)),
             "one_off_lump_month": int(data.get('one_off_lump_month', 0)),
             "rate_changes": _parse_rate_changes(data.get('rate_changes', '')),
+            "rate_curve": rate_curve,
+            "payment_frequency": normalize_frequency(data.get('payment_frequency')),
+            "start_date": parse_start_date(data.get('start_date')),
             "inflation": float(data.get('inflation', 0.0))
         }
 
-    def calculate_overpayment_summary(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        p = self._parse_mortgage_data(data)
-        
-        if p['principal'] <= 0 or p['years'] <= 0:
-            return {'error': 'Invalid loan amount or years.'}
-
-        sim_inputs = {
+    def _overpay_sim_inputs(self, p: Dict[str, Any]) -> Dict[str, Any]:
+        return {
             "principal": p['principal'],
             "annual_rate_pct": p['annual_rate_pct'],
             "years": p['years'],
@@ -230,25 +641,17 @@ class AmortizationEngine:
             "annual_lump_month": p['annual_lump_month'],
             "one_off_lump": p['one_off_lump'],
             "one_off_lump_month": p['one_off_lump_month'],
-            "rate_changes": p['rate_changes']
+            "rate_changes": p['rate_changes'],
+            "rate_curve": p['rate_curve']
         }
 
-        base_hist, base_first = self._amortize_flexible(
-            principal=p['principal'], annual_rate_pct=p['annual_rate_pct'], years=p['years'],
-            rate_changes=p['rate_changes']
-        )
-        
-        over_hist, over_first = self._amortize_flexible(**sim_inputs)
-        
-        base_interest = sum(h["Interest"] for h in base_hist)
-        over_interest = sum(h["Interest"] for h in over_hist)
-        base_months = len(base_hist)
-        over_months = len(over_hist)
-        
+    def _overpayment_structured_summary(self, p: Dict[str, Any], base_first: float, over_first: float,
+                                        base_interest: float, over_interest: float,
+                                        base_months: int, over_months: int) -> Dict[str, Any]:
         typical_overpay = over_first + p['monthly_overpay'] + (over_first * (p['overpay_pct_of_base'] / 100.0))
         ltv = (p['principal'] / p['propval'] * 100.0) if p['propval'] > 0 else "N/A"
         
-        structured_summary = {
+        summary = {
             'base_monthly_payment': round(base_first, 2),
             'overpay_monthly_payment': round(typical_overpay, 2),
             'time_saved_years': round((base_months - over_months) / 12.0, 1),
@@ -259,13 +662,54 @@ class AmortizationEngine:
             'baseline_months': base_months,
             'overpay_months': over_months
         }
+        if p.get('payment_frequency', 'monthly') != 'monthly':
+            summary['payment_frequency'] = p['payment_frequency']
+            summary['base_period_payment'] = round(base_first * 12.0 / PERIODS_PER_YEAR[p['payment_frequency']], 2)
+        return summary
+
+    def _rate_change_months(self, p: Dict[str, Any]) -> List[int]:
+        """Months where the rate moves: explicit rate_changes plus curve resets (which only exist where the rate changes)."""
+        months = set(p['rate_changes'])
+        if p['rate_curve']:
+            plan = curve_plan(p['rate_curve'], p['annual_rate_pct'], max(1, p['years'] * 12))
+            months.update(plan.resets)
+        return sorted(months)
+
+    def calculate_overpayment_summary(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        p = self._parse_mortgage_data(data)
         
-        return {
+        if p['principal'] <= 0 or p['years'] <= 0:
+            return {'error': 'Invalid loan amount or years.'}
+
+        sim_inputs = self._overpay_sim_inputs(p)
+        sens_month = _sensitivity_option(data)
+        sens = {} if sens_month else None
+
+        base_hist, base_first = self._amortize_for(
+            p, principal=p['principal'], annual_rate_pct=p['annual_rate_pct'], years=p['years'],
+            rate_changes=p['rate_changes'], rate_curve=p['rate_curve'],
+            **_sensitivity_kwargs(sens, 'baseline', sens_month)
+        )
+        
+        over_hist, over_first = self._amortize_for(p, **sim_inputs, **_sensitivity_kwargs(sens, 'overpay', sens_month))
+        
+        base_interest = sum(h["Interest"] for h in base_hist)
+        over_interest = sum(h["Interest"] for h in over_hist)
+        
+        structured_summary = self._overpayment_structured_summary(
+            p, base_first, over_first, base_interest, over_interest, len(base_hist), len(over_hist)
+        )
+        
+        result = {
             'structured_summary': structured_summary,
-            'chart_data': _generate_chart_data(base_hist, over_hist, p['principal']),
+            'chart_data': _generate_chart_data(base_hist, over_hist, p['principal'],
+                                               _chart_points_option(data), self._rate_change_months(p)),
             'yearly_schedule': _generate_yearly_schedule_from_capitalized(over_hist, p['principal']),
             'monthly_schedule': _normalize_monthly_history(over_hist)
         }
+        if sens and all(sens.values()):
+            result['sensitivities'] = sens
+        return result
 
     def calculate_rollover_summary(self, data: Dict[str, Any]) -> Dict[str, Any]:
         # (This function is unchanged)
@@ -276,14 +720,19 @@ class AmortizationEngine:
         if eur_inputs['principal'] <= 0 or gbp_inputs['principal'] <= 0:
             return {'error': 'EUR or GBP mortgage data is missing or invalid.'}
 
-        eur_inputs.pop('propval', None); eur_inputs.pop('inflation', None)
-        gbp_inputs.pop('propval', None); gbp_inputs.pop('inflation', None)
+        for inputs in (eur_inputs, gbp_inputs):
+            for key in ('propval', 'inflation', 'payment_frequency', 'start_date'):
+                inputs.pop(key, None)
+
+        sens_month = _sensitivity_option(data)
+        sens = {} if sens_month else None
 
         eur_base_hist, _ = self._amortize_flexible(
             principal=eur_inputs['principal'], annual_rate_pct=eur_inputs['annual_rate_pct'], years=eur_inputs['years'],
-            rate_changes=eur_inputs.get('rate_changes')
+            rate_changes=eur_inputs.get('rate_changes'), rate_curve=eur_inputs.get('rate_curve'),
+            **_sensitivity_kwargs(sens, 'eur_baseline', sens_month)
         )
-        eur_over_hist, eur_first_payment = self._amortize_flexible(**eur_inputs)
+        eur_over_hist, eur_first_payment = self._amortize_flexible(**eur_inputs, **_sensitivity_kwargs(sens, 'eur_overpay', sens_month))
         
         eur_months = len(eur_over_hist)
         eur_years = round(eur_months / 12.0, 1)
@@ -293,7 +742,7 @@ class AmortizationEngine:
         freed_eur = eur_first_payment + eur_inputs.get('monthly_overpay', 0.0) + (eur_first_payment * (eur_inputs.get('overpay_pct_of_base', 0.0) / 100.0))
         freed_gbp = freed_eur * rate
 
-        uk_over_hist, _ = self._amortize_flexible(**gbp_inputs)
+        uk_over_hist, _ = self._amortize_flexible(**gbp_inputs, **_sensitivity_kwargs(sens, 'uk_baseline', sens_month))
         
         uk_baseline_years = round(len(uk_over_hist) / 12.0, 1)
         uk_baseline_interest_total = sum(h["Interest"] for h in uk_over_hist)
@@ -320,8 +769,10 @@ class AmortizationEngine:
             if month > eur_months:
                 new_rate_changes[month - eur_months] = new_rate
         post_roll_inputs['rate_changes'] = new_rate_changes
+        if post_roll_inputs.get('rate_curve'):
+            post_roll_inputs['rate_curve_offset'] = eur_months
 
-        uk_post_roll_hist, _ = self._amortize_flexible(**post_roll_inputs)
+        uk_post_roll_hist, _ = self._amortize_flexible(**post_roll_inputs, **_sensitivity_kwargs(sens, 'uk_post_roll', sens_month))
         
         uk_post_roll_months = len(uk_post_roll_hist)
         uk_post_roll_years = round(uk_post_roll_months / 12.0, 1)
@@ -333,7 +784,7 @@ class AmortizationEngine:
         time_saved = round(uk_baseline_years - uk_post_roll_years, 1)
         total_free_time = round(eur_years + uk_post_roll_years, 1)
 
-        return {
+        result = {
             "eur_payoff_time_years": eur_years, "eur_payoff_time_months": eur_months,
             "eur_freed_payment": round(freed_eur, 2), "gbp_freed_payment": round(freed_gbp, 2),
             "conversion_rate": rate, "eur_baseline_interest": round(eur_interest_baseline, 2),
@@ -354,6 +805,9 @@ class AmortizationEngine:
             "comparison_time_saved_years": time_saved,
             "total_mortgage_free_time_years": total_free_time
         }
+        if sens:
+            result["sensitivities"] = sens
+        return result
 
     def calculate_refinance_summary(self, data: Dict[str, Any]) -> Dict[str, Any]:
         # (This function is unchanged)
@@ -370,9 +824,12 @@ class AmortizationEngine:
                 "annual_lump_month": curr_parsed.get('annual_lump_month', 12),
                 "one_off_lump": curr_parsed.get('one_off_lump', 0.0),
                 "one_off_lump_month": curr_parsed.get('one_off_lump_month', 0),
-                "rate_changes": curr_parsed.get('rate_changes', {})
+                "rate_changes": curr_parsed.get('rate_changes', {}),
+                "rate_curve": curr_parsed.get('rate_curve')
             }
-            base_hist, _ = self._amortize_flexible(**sim_inputs)
+            sens_month = _sensitivity_option(data)
+            sens = {} if sens_month else None
+            base_hist, _ = self._amortize_flexible(**sim_inputs, **_sensitivity_kwargs(sens, 'baseline', sens_month))
 
             months_elapsed = int(data.get('months_elapsed', 0))
             outstanding = base_hist[months_elapsed - 1]['Balance'] if months_elapsed > 0 and months_elapsed <= len(base_hist) else curr_parsed['principal']
@@ -380,6 +837,7 @@ class AmortizationEngine:
             ref_principal = float(ref.get('loan', outstanding))
             ref_parsed_rate = _normalize_rate_input(ref.get('rate', 0.0))
             ref_years = int(ref.get('years', curr_parsed['years']))
+            ref_curve = normalize_curve_spec(ref.get('rate_curve'))
 
             ref_sim_inputs = {
                 "principal": ref_principal, "annual_rate_pct": ref_parsed_rate, "years": ref_years,
@@ -389,9 +847,10 @@ class AmortizationEngine:
                 "annual_lump_month": int(ref.get('annual_lump_month', 12)),
                 "one_off_lump": float(ref.get('one_off_lump', 0.0)),
                 "one_off_lump_month": int(ref.get('one_off_lump_month', 0)),
-                "rate_changes": _parse_rate_changes(ref.get('rate_changes', ''))
+                "rate_changes": _parse_rate_changes(ref.get('rate_changes', '')),
+                "rate_curve": ref_curve
             }
-            ref_hist, _ = self._amortize_flexible(**ref_sim_inputs)
+            ref_hist, _ = self._amortize_flexible(**ref_sim_inputs, **_sensitivity_kwargs(sens, 'refinance', sens_month))
 
             def cum_interest(hist):
                 cum = []; s = 0.0
@@ -411,7 +870,7 @@ class AmortizationEngine:
             base_total_interest = sum(r['Interest'] for r in base_hist)
             ref_total_interest = sum(r['Interest'] for r in ref_hist) + fees
 
-            return {
+            result = {
                 'baseline_monthly': _normalize_monthly_history(base_hist),
                 'refinance_monthly': _normalize_monthly_history(ref_hist),
                 'break_even_month': break_even, 'fees': round(fees, 2),
@@ -419,58 +878,254 @@ class AmortizationEngine:
                 'refinance_total_interest': round(ref_total_interest, 2),
                 'interest_saved': round(base_total_interest - (ref_total_interest - fees), 2)
             }
+            if sens:
+                result['sensitivities'] = sens
+            return result
         except Exception as e:
             return {'error': f'Refinance calculation error: {str(e)}'}
 
+    def _prepare_calculator(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Validates calculator inputs and works out the summary, which needs no simulation."""
+        p = float(data.get('loan_amount', 0.0))
+        r_pct = _normalize_rate_input(data.get('annual_rate', 0.0))
+        y_curr = int(data.get('current_years', 0))
+        y_targ = int(data.get('target_years', 0))
+        
+        if p <= 0 or y_curr <= 0 or y_targ <= 0: return {'error': 'Invalid inputs.'}
+        if y_targ >= y_curr: return {'error': 'Target years must be less than current years.'}
+
+        r_m = (r_pct / 100.0) / 12.0
+        base_monthly = _base_payment_for(p, r_m, y_curr * 12)
+        target_monthly = _base_payment_for(p, r_m, y_targ * 12)
+        
+        req_overpay = max(0.0, target_monthly - base_monthly)
+        annual_overpay = req_overpay * 12.0
+        percent_of_loan = (annual_overpay / p * 100.0) if p > 0 else 0.0
+        
+        return {
+            'principal': p,
+            'sim_inputs': {'principal': p, 'annual_rate_pct': r_pct, 'years': y_curr, 'monthly_overpay': req_overpay},
+            'structured_summary': {
+                'base_monthly': round(base_monthly, 2),
+                'target_monthly': round(target_monthly, 2),
+                'required_overpayment': round(req_overpay, 2),
+                'annual_overpayment': round(annual_overpay, 2),
+                'percent_of_loan': round(percent_of_loan, 2),
+                'cap_status': "Within 10% cap" if percent_of_loan <= 10.0 else "Exceeds 10% cap"
+            }
+        }
+
     def run_calculator(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        # (This function is unchanged)
         try:
-            p = float(data.get('loan_amount', 0.0))
-            r_pct = _normalize_rate_input(data.get('annual_rate', 0.0))
-            y_curr = int(data.get('current_years', 0))
-            y_targ = int(data.get('target_years', 0))
-            
-            if p <= 0 or y_curr <= 0 or y_targ <= 0: return {'error': 'Invalid inputs.'}
-            if y_targ >= y_curr: return {'error': 'Target years must be less than current years.'}
-
-            r_m = (r_pct / 100.0) / 12.0
-            base_monthly = _base_payment_for(p, r_m, y_curr * 12)
-            target_monthly = _base_payment_for(p, r_m, y_targ * 12)
+            plan = self._prepare_calculator(data)
+            if 'error' in plan: return plan
+            p = plan['principal']
             
-            req_overpay = max(0.0, target_monthly - base_monthly)
-            annual_overpay = req_overpay * 12.0
-            percent_of_loan = (annual_overpay / p * 100.0) if p > 0 else 0.0
+            sens_month = _sensitivity_option(data)
+            sens = {} if sens_month else None
+            sim_hist, _ = self._amortize_flexible(**plan['sim_inputs'], **_sensitivity_kwargs(sens, 'overpay', sens_month))
             
-            sim_hist, _ = self._amortize_flexible(
-                principal=p, annual_rate_pct=r_pct, years=y_curr,
-                monthly_overpay=req_overpay
-            )
-            
-            return {
-                'structured_summary': {
-                    'base_monthly': round(base_monthly, 2),
-                    'target_monthly': round(target_monthly, 2),
-                    'required_overpayment': round(req_overpay, 2),
-                    'annual_overpayment': round(annual_overpay, 2),
-                    'percent_of_loan': round(percent_of_loan, 2),
-                    'cap_status': "Within 10% cap" if percent_of_loan <= 10.0 else "Exceeds 10% cap"
-                },
+            result = {
+                'structured_summary': plan['structured_summary'],
                 'yearly_schedule': _generate_yearly_schedule_from_capitalized(sim_hist, p),
                 'monthly_schedule': _normalize_monthly_history(sim_hist),
-                'chart_data': _generate_chart_data([], sim_hist, p)
+                'chart_data': _generate_chart_data([], sim_hist, p, _chart_points_option(data))
             }
+            if sens:
+                result['sensitivities'] = sens
+            return result
         except Exception as e:
             return {'error': f'Calculation error: {str(e)}'}
 
+    # -----------------------
+    # OVERPAYMENT BUDGET OPTIMIZER
+    # -----------------------
+    def optimize_overpayment_allocation(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Splits a fixed yearly overpayment budget across monthly_overpay, overpay_pct_of_base
+        and annual_lump (plus its month), and picks the month of an optional one-off lump.
+        Returns the interest-minimizing and term-minimizing allocations and the Pareto frontier.
+        """
+        try:
+            started = time.perf_counter()
+            p = self._parse_mortgage_data(data)
+            if p['principal'] <= 0 or p['years'] <= 0:
+                return {'error': 'Invalid loan amount or years.'}
+
+            yearly_budget = float(data.get('yearly_budget', 0.0))
+            one_off_budget = float(data.get('one_off_budget', 0.0))
+            if yearly_budget <= 0 and one_off_budget <= 0:
+                return {'error': 'Please enter a yearly overpayment budget.'}
+
+            step_pct = min(50.0, max(5.0, float(data.get('step_pct', 10.0))))
+            steps = int(round(100.0 / step_pct))
+            lump_months = sorted({int(x) for x in data.get('lump_months', range(1, 13)) if 1 <= int(x) <= 12}) or [12]
+            one_off_months = sorted({int(x) for x in data.get('one_off_months', range(1, 13)) if int(x) >= 1}) or [1]
+
+            # Lender cap: yearly overpayments as a % of the original loan, as in run_calculator
+            cap_amount = None
+            budget = yearly_budget
+            one_off = one_off_budget
+            if data.get('respect_cap', False):
+                cap_amount = p['principal'] * float(data.get('cap_pct', 10.0)) / 100.0
+                budget = min(budget, cap_amount)
+                one_off = max(0.0, min(one_off, cap_amount - budget))
+
+            r_month = p['annual_rate_pct'] / 100.0 / 12.0
+            first_base = _base_payment_for(p['principal'], r_month, max(1, int(p['years'] * 12)))
+            base_inputs = {
+                "principal": p['principal'], "annual_rate_pct": p['annual_rate_pct'],
+                "years": p['years'], "rate_changes": p['rate_changes'], "rate_curve": p['rate_curve']
+            }
+            base_interest, base_months = self._amortize_totals(**base_inputs)
+
+            # Without rate changes the base payment never moves, so a % of base is just another
+            # fixed monthly amount: fold that channel into monthly_overpay instead of searching it.
+            rate_moves = bool(self._rate_change_months(p))
+
+            def share_grid(n):
+                if budget <= 0:
+                    # One-off only: every split of a zero yearly budget is the same allocation
+                    return [(1.0, 0.0, 0.0)]
+                return [(i / n, j / n, (n - i - j) / n)
+                        for i in range(n + 1) for j in range(n + 1 - i) if rate_moves or not j]
+
+            def has_lump(share):
+                return round(budget * share[2], 2) > 0
+
+            # Long terms make every run longer: coarsen the grid until phase 1 fits the month budget,
+            # keeping a fifth of it for phase 2's one-off timing
+            search_one_off = one_off > 0 and len(one_off_months) > 1
+            phase1_budget = _OPTIMIZER_MONTH_BUDGET * (0.8 if search_one_off else 1.0)
+            shares = share_grid(steps)
+            while steps > 2 and sum(len(lump_months) if has_lump(s) else 1 for s in shares) * base_months > phase1_budget:
+                steps -= 1
+                shares = share_grid(steps)
+
+            evaluated: Dict[Tuple, Dict[str, Any]] = {}
+            frontier: List[Tuple[float, int]] = []
+            stats = {'evaluations': 0, 'pruned': 0, 'over_budget': 0}
+
+            def allocation(share, lump_month, one_off_month):
+                s_monthly, s_pct, s_lump = share
+                return {
+                    "monthly_overpay": round(budget * s_monthly / 12.0, 2),
+                    "overpay_pct_of_base": round((budget * s_pct / 12.0) / first_base * 100.0, 4) if first_base > 0 else 0.0,
+                    "annual_lump": round(budget * s_lump, 2),
+                    "annual_lump_month": lump_month if has_lump(share) else 12,
+                    "one_off_lump": round(one_off, 2),
+                    "one_off_lump_month": one_off_month if one_off > 0 else 0
+                }
+
+            def evaluate(share, lump_month, one_off_month):
+                alloc = allocation(share, lump_month, one_off_month)
+                key = tuple(alloc.values())
+                if key in evaluated:
+                    return
+                stats['evaluations'] += 1
+                # The % of base channel may not outspend its share of the budget (and so the cap) in any year
+                res = self._amortize_totals(frontier=frontier, pct_spend_limit=budget * share[1], **base_inputs, **alloc)
+                if res is False:
+                    stats['over_budget'] += 1
+                    evaluated[key] = None
+                    return
+                if res is None:
+                    stats['pruned'] += 1
+                    evaluated[key] = None
+                    return
+                interest, months = res
+                evaluated[key] = dict(alloc, shares={
+                    "monthly_overpay": share[0], "overpay_pct_of_base": share[1], "annual_lump": share[2]
+                }, total_interest=interest, months=months)
+                frontier[:] = [f for f in frontier if not (interest <= f[0] and months <= f[1])]
+                if not any(f[0] <= interest and f[1] <= months for f in frontier):
+                    frontier.append((interest, months))
+
+            # Phase 1: budget split and annual lump timing, one-off at its earliest allowed month
+            for share in shares:
+                for lump_month in (lump_months if has_lump(share) else [12]):
+                    evaluate(share, lump_month, one_off_months[0])
+
+            # Phase 2: one-off timing for the best few allocations found so far
+            if search_one_off:
+                runs_left = max(1, int((_OPTIMIZER_MONTH_BUDGET - stats['evaluations'] * base_months) // base_months))
+                later_months = one_off_months[1:]
+                if len(later_months) > runs_left:
+                    later_months = later_months[::math.ceil(len(later_months) / runs_left)]
+                n_leaders = min(5, max(1, runs_left // len(later_months)))
+                leaders = sorted((c for c in evaluated.values() if c), key=lambda c: (c['total_interest'], c['months']))[:n_leaders]
+                for c in leaders:
+                    share = (c['shares']['monthly_overpay'], c['shares']['overpay_pct_of_base'], c['shares']['annual_lump'])
+                    for one_off_month in later_months:
+                        evaluate(share, c['annual_lump_month'], one_off_month)
+
+            candidates = [c for c in evaluated.values() if c]
+
+            def present(c):
+                out = dict(c)
+                out['total_interest'] = round(c['total_interest'], 2)
+                out['interest_saved'] = round(base_interest - c['total_interest'], 2)
+                out['time_saved_years'] = round((base_months - c['months']) / 12.0, 1)
+                return out
+
+            best_interest = min(candidates, key=lambda c: (c['total_interest'], c['months']))
+            best_term = min(candidates, key=lambda c: (c['months'], c['total_interest']))
+            # Non-dominated allocations, one per (months, interest) point: ties add nothing to the frontier
+            pareto = {}
+            for c in candidates:
+                if not any(o['total_interest'] <= c['total_interest'] and o['months'] <= c['months']
+                           and (o['total_interest'] < c['total_interest'] or o['months'] < c['months'])
+                           for o in candidates):
+                    pareto.setdefault((c['months'], c['total_interest']), c)
+            pareto = [pareto[k] for k in sorted(pareto)]
+
+            if cap_amount is None:
+                cap_status = "Not applied"
+            else:
+                cap_pct = float(data.get('cap_pct', 10.0))
+                cap_status = f"Within {cap_pct:g}% cap" if yearly_budget + one_off_budget <= cap_amount else f"Budget trimmed to {cap_pct:g}% cap"
+
+            return {
+                'structured_summary': {
+                    'yearly_budget': round(yearly_budget, 2),
+                    'effective_yearly_budget': round(budget, 2),
+                    'effective_one_off': round(one_off, 2),
+                    'step_pct': round(100.0 / steps, 2),
+                    'cap_status': cap_status,
+                    'baseline_interest': round(base_interest, 2),
+                    'baseline_months': base_months,
+                    'evaluations': stats['evaluations'],
+                    'pruned': stats['pruned'],
+                    'over_budget': stats['over_budget'],
+                    'elapsed_ms': round((time.perf_counter() - started) * 1000.0, 1)
+                },
+                'min_interest': present(best_interest),
+                'min_term': present(best_term),
+                'pareto_frontier': [present(c) for c in pareto]
+            }
+        except Exception as e:
+            return {'error': f'Optimizer error: {str(e)}'}
+
     # -----------------------
     # CREDIT CARD PAYOFF
     # -----------------------
     def _calculate_revolving_payoff(self, balance, apr, min_payment_pct, min_payment_flat, fixed_payment):
         """Helper to run a single credit card payoff simulation."""
+        box: List[Any] = []
+        history = list(_capture_result(
+            self._iter_revolving_payoff(balance, apr, min_payment_pct, min_payment_flat, fixed_payment), box
+        ))
+        total_interest, month = box[0]
+        return history, total_interest, month
+
+    def _iter_revolving_payoff(self, balance, apr, min_payment_pct, min_payment_flat, fixed_payment):
+        """
+        Lazily yields the monthly rows of a credit card payoff.
+        The generator's return value is (total_interest, months), months being -1 for a debt spiral.
+        """
         bal = float(balance)
         r_m = float(apr) / 100.0 / 12.0
         
-        history = []
         month = 0
         total_interest = 0.0
         
@@ -493,7 +1148,7 @@ class AmortizationEngine:
                 payment = interest + 1 # Pay at least £1 principle
                 if month > 12: # If it's still not working after a year, break
                      # This is a debt spiral, cap it
-                     return history, total_interest, -1 # -1 indicates debt spiral
+                     return total_interest, -1 # -1 indicates debt spiral
             
             principal_paid = payment - interest
             
@@ -505,15 +1160,50 @@ class AmortizationEngine:
             else:
                 bal -= principal_paid
                 
-            history.append({
+            yield {
                 "Month": month,
                 "Payment": round(payment, 2),
                 "Principal": round(principal_paid, 2),
                 "Interest": round(interest, 2),
                 "Balance": round(bal, 2)
-            })
+            }
             
-        return history, total_interest, month
+        return total_interest, month
+
+    def _parse_revolving_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        balance = float(data.get('balance', 0.0))
+        apr = _normalize_rate_input(data.get('apr', 0.0))
+        fixed_payment = float(data.get('fixed_payment', 0.0))
+        
+        if balance <= 0 or apr <= 0:
+            return {'error': 'Please enter a valid balance and APR.'}
+
+        if fixed_payment > 0:
+            # Check if fixed payment is high enough
+            first_interest = balance * (apr / 100.0 / 12.0)
+            if fixed_payment <= first_interest:
+                return {
+                    'error': f'Your fixed payment (£{fixed_payment:,.2f}) must be higher than the first month\'s interest (£{first_interest:,.2f}) to pay off the debt.'
+                }
+
+        return {
+            'balance': balance,
+            'apr': apr,
+            'min_pct': float(data.get('min_payment_pct', 2.0)),
+            'min_flat': float(data.get('min_payment_flat', 25.0)),
+            'fixed_payment': fixed_payment
+        }
+
+    def _revolving_structured_summary(self, fixed_payment: float, min_interest: float, min_months: int,
+                                      fixed_interest: float, fixed_months: int) -> Dict[str, Any]:
+        return {
+            'min_pay_months': min_months,
+            'min_pay_interest': round(min_interest, 2),
+            'fixed_pay_months': fixed_months,
+            'fixed_pay_interest': round(fixed_interest, 2),
+            'interest_saved': round(min_interest - fixed_interest, 2) if fixed_payment > 0 else 0.0,
+            'time_saved_years': round((min_months - fixed_months) / 12.0, 1) if fixed_payment > 0 else 0.0
+        }
 
     def calculate_revolving_debt(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -521,47 +1211,31 @@ class AmortizationEngine:
         Compares minimum payment vs. a fixed payment.
         """
         try:
-            balance = float(data.get('balance', 0.0))
-            apr = _normalize_rate_input(data.get('apr', 0.0))
-            min_pct = float(data.get('min_payment_pct', 2.0))
-            min_flat = float(data.get('min_payment_flat', 25.0))
-            fixed_payment = float(data.get('fixed_payment', 0.0))
-            
-            if balance <= 0 or apr <= 0:
-                return {'error': 'Please enter a valid balance and APR.'}
+            c = self._parse_revolving_data(data)
+            if 'error' in c:
+                return c
+            balance, fixed_payment = c['balance'], c['fixed_payment']
 
             # 1. Minimum Payment Simulation
             min_hist, min_interest, min_months = self._calculate_revolving_payoff(
-                balance, apr, min_pct, min_flat, 0
+                balance, c['apr'], c['min_pct'], c['min_flat'], 0
             )
             
             # 2. Fixed Payment Simulation
             if fixed_payment > 0:
-                # Check if fixed payment is high enough
-                first_interest = balance * (apr / 100.0 / 12.0)
-                if fixed_payment <= first_interest:
-                    return {
-                        'error': f'Your fixed payment (£{fixed_payment:,.2f}) must be higher than the first month\'s interest (£{first_interest:,.2f}) to pay off the debt.'
-                    }
-                
                 fixed_hist, fixed_interest, fixed_months = self._calculate_revolving_payoff(
-                    balance, apr, 0, 0, fixed_payment
+                    balance, c['apr'], 0, 0, fixed_payment
                 )
             else:
                 fixed_hist, fixed_interest, fixed_months = [], 0.0, 0
 
             # 3. Format results
             return {
-                'structured_summary': {
-                    'min_pay_months': min_months,
-                    'min_pay_interest': round(min_interest, 2),
-                    'fixed_pay_months': fixed_months,
-                    'fixed_pay_interest': round(fixed_interest, 2),
-                    'interest_saved': round(min_interest - fixed_interest, 2) if fixed_payment > 0 else 0.0,
-                    'time_saved_years': round((min_months - fixed_months) / 12.0, 1) if fixed_payment > 0 else 0.0
-                },
+                'structured_summary': self._revolving_structured_summary(
+                    fixed_payment, min_interest, min_months, fixed_interest, fixed_months
+                ),
                 # We can reuse the same chart/table models
-                'chart_data': _generate_chart_data(min_hist, fixed_hist, balance),
+                'chart_data': _generate_chart_data(min_hist, fixed_hist, balance, _chart_points_option(data)),
                 'yearly_schedule': _generate_yearly_schedule_from_capitalized(fixed_hist, balance),
                 'monthly_schedule': _normalize_monthly_history(fixed_hist)
             }
@@ -581,7 +1255,8 @@ class AmortizationEngine:
             contribution = float(data.get('contribution_amount', 0.0))
             annual_rate = float(data.get('annual_rate', 0.0))
             years = int(data.get('years', 0))
-            frequency = data.get('frequency', 'monthly').lower()
+            # Same aliases as payment_frequency ('biweekly' etc.); daily accrual contributes monthly
+            frequency = normalize_frequency(data.get('frequency', 'monthly'))
             
             if years <= 0:
                 return {'error': 'Projection years must be greater than zero.'}
@@ -589,16 +1264,14 @@ class AmortizationEngine:
             periods = years * 12
             r_annual = annual_rate / 100.0
             r_monthly = r_annual / 12.0
+            # Weekly / fortnightly: the actual number of contributions landing in each month
+            counts = contributions_per_month(frequency, periods, parse_start_date(data.get('start_date'))).tolist()
             
             history: List[Dict[str, Any]] = []
 
             for month in range(1, periods + 1):
-                # 1. Apply Contribution based on frequency
-                if frequency == 'monthly':
-                    balance += contribution
-                elif frequency == 'weekly':
-                    # 4.3333 weeks per month
-                    balance += contribution * (4.33333) 
+                # 1. Apply Contribution based on frequency (one per month unless weekly / fortnightly)
+                balance += contribution * counts[month - 1]
                 
                 # 2. Apply Interest
                 interest = balance * r_monthly
@@ -617,9 +1290,151 @@ class AmortizationEngine:
         except Exception as e:
             return {'error': f'Savings growth calculation error: {str(e)}'}
 
+    # -----------------------
+    # STREAMING (NDJSON)
+    # -----------------------
+    def stream_overpayment_summary(self, data: Dict[str, Any], chunk_size: int = 12) -> Iterator[Dict[str, Any]]:
+        """Streamed variant of calculate_overpayment_summary; the summary record comes last."""
+        p = self._parse_mortgage_data(data)
+        if p['principal'] <= 0 or p['years'] <= 0:
+            yield {'type': 'error', 'error': 'Invalid loan amount or years.'}
+            return
+
+        sim_inputs = self._overpay_sim_inputs(p)
+        base_inputs = {
+            "principal": p['principal'], "annual_rate_pct": p['annual_rate_pct'], "years": p['years'],
+            "rate_changes": p['rate_changes'], "rate_curve": p['rate_curve']
+        }
+        sens_month = _sensitivity_option(data)
+        sens = {} if sens_month and p['payment_frequency'] == 'monthly' else None
+        if p['payment_frequency'] == 'monthly':
+            base_rows = self._iter_flexible(**base_inputs, **_sensitivity_kwargs(sens, 'baseline', sens_month))
+            over_rows = self._iter_flexible(**sim_inputs, **_sensitivity_kwargs(sens, 'overpay', sens_month))
+            r_month = p['annual_rate_pct'] / 100.0 / 12.0
+            first = _base_payment_for(p['principal'], r_month, max(1, int(p['years'] * 12)))
+        else:
+            # The periodic engine solves whole rate segments at once, so there is nothing to interleave
+            base_hist, first = self._amortize_for(p, **base_inputs)
+            base_rows, over_rows = iter(base_hist), iter(self._amortize_for(p, **sim_inputs)[0])
+        totals = yield from _stream_schedule(base_rows, over_rows, p['principal'], chunk_size)
+
+        record = {'type': 'summary', 'structured_summary': self._overpayment_structured_summary(
+            p, first, first, totals['base_interest'], totals['over_interest'],
+            totals['base_months'], totals['over_months']
+        )}
+        if sens:
+            record['sensitivities'] = sens
+        yield record
+
+    def stream_calculator(self, data: Dict[str, Any], chunk_size: int = 12) -> Iterator[Dict[str, Any]]:
+        """
+        Streamed variant of run_calculator; the summary is known up front so it comes first.
+        Requested sensitivities need the whole schedule, so they follow in a final record.
+        """
+        plan = self._prepare_calculator(data)
+        if 'error' in plan:
+            yield {'type': 'error', 'error': plan['error']}
+            return
+        yield {'type': 'summary', 'structured_summary': plan['structured_summary']}
+        sens_month = _sensitivity_option(data)
+        sens = {} if sens_month else None
+        rows = self._iter_flexible(**plan['sim_inputs'], **_sensitivity_kwargs(sens, 'overpay', sens_month))
+        yield from _stream_schedule(iter(()), rows, plan['principal'], chunk_size)
+        if sens:
+            yield {'type': 'sensitivities', 'sensitivities': sens}
+
+    def stream_revolving_debt(self, data: Dict[str, Any], chunk_size: int = 12) -> Iterator[Dict[str, Any]]:
+        """Streamed variant of calculate_revolving_debt; the summary record comes last."""
+        c = self._parse_revolving_data(data)
+        if 'error' in c:
+            yield {'type': 'error', 'error': c['error']}
+            return
+
+        min_box: List[Any] = []
+        fixed_box: List[Any] = []
+        min_rows = _capture_result(self._iter_revolving_payoff(c['balance'], c['apr'], c['min_pct'], c['min_flat'], 0), min_box)
+        if c['fixed_payment'] > 0:
+            fixed_rows = _capture_result(self._iter_revolving_payoff(c['balance'], c['apr'], 0, 0, c['fixed_payment']), fixed_box)
+        else:
+            fixed_rows = iter(())
+            fixed_box.append((0.0, 0))
+        yield from _stream_schedule(min_rows, fixed_rows, c['balance'], chunk_size)
+
+        (min_interest, min_months), (fixed_interest, fixed_months) = min_box[0], fixed_box[0]
+        yield {'type': 'summary', 'structured_summary': self._revolving_structured_summary(
+            c['fixed_payment'], min_interest, min_months, fixed_interest, fixed_months
+        )}
+
 # -----------------------
 # Excel Exporter (Fix for "not defined" error)
 # -----------------------
+def _excel_formats(workbook) -> Dict[str, Any]:
+    return {
+        'header': workbook.add_format({'bold': True, 'bg_color': '#DCE6F1', 'border':1}),
+        'currency': workbook.add_format({'num_format': '£#,##0.00', 'border':1}),
+        'int': workbook.add_format({'num_format': '0', 'border':1}),
+        'default': workbook.add_format({'border':1})
+    }
+
+def _format_excel_sheet(writer, formats: Dict[str, Any], sheet_name: str, df: pd.DataFrame) -> None:
+    worksheet = writer.sheets[sheet_name]
+    worksheet.set_row(0, None, formats['header'])
+    if df.empty: return
+    for i, col in enumerate(df.columns):
+        width = max(12, min(40, len(str(col)) + 2))
+        if any(x in str(col).lower() for x in ('balance','payment','principal','interest','fees','amount','total')):
+            worksheet.set_column(i, i, width, formats['currency'])
+        elif 'month' in str(col).lower() or 'year' in str(col).lower():
+            worksheet.set_column(i, i, width, formats['int'])
+        else:
+            worksheet.set_column(i, i, width, formats['default'])
+
+def _write_workbook_bytes(sheets_and_dfs: Dict[str, pd.DataFrame]) -> bytes:
+    """Writes each DataFrame to its own formatted sheet and returns the .xlsx bytes."""
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
+        for sn, df in sheets_and_dfs.items():
+            df.to_excel(writer, sheet_name=sn, index=False)
+        formats = _excel_formats(writer.book)
+        for sn, df in sheets_and_dfs.items():
+            _format_excel_sheet(writer, formats, sn, df)
+    buffer.seek(0)
+    return buffer.read()
+
+def _summary_frame(summary: Dict[str, Any]) -> pd.DataFrame:
+    return pd.DataFrame([{'metric': k, 'value': v} for k, v in summary.items()])
+
+def _export_overpayment_to_excel_bytes(result: Dict[str, Any]) -> Tuple[bytes, str]:
+    sheets = {
+        'Monthly': pd.DataFrame(result.get('monthly_schedule', [])),
+        'Yearly': pd.DataFrame(result.get('yearly_schedule', [])),
+        'Chart_Data': pd.DataFrame(result.get('chart_data', [])),
+        'Summary': _summary_frame(result.get('structured_summary', {}))
+    }
+    return _write_workbook_bytes(sheets), "overpayment_analysis.xlsx"
+
+def _export_refinance_to_excel_bytes(result: Dict[str, Any]) -> Tuple[bytes, str]:
+    base = result.get('baseline_monthly', [])
+    ref = result.get('refinance_monthly', [])
+    summary_keys = ['break_even_month', 'fees', 'baseline_total_interest', 'refinance_total_interest', 'interest_saved']
+    sheets = {
+        'Baseline_Monthly': pd.DataFrame(base),
+        'Refinance_Monthly': pd.DataFrame(ref),
+        'Baseline_Yearly': pd.DataFrame(_generate_yearly_schedule_from_normalized(base)),
+        'Refinance_Yearly': pd.DataFrame(_generate_yearly_schedule_from_normalized(ref)),
+        'Summary': _summary_frame({k: result[k] for k in summary_keys if k in result})
+    }
+    return _write_workbook_bytes(sheets), "refinance_analysis.xlsx"
+
+def _export_revolving_to_excel_bytes(result: Dict[str, Any]) -> Tuple[bytes, str]:
+    sheets = {
+        'Fixed_Payment_Monthly': pd.DataFrame(result.get('monthly_schedule', [])),
+        'Fixed_Payment_Yearly': pd.DataFrame(result.get('yearly_schedule', [])),
+        'Chart_Data': pd.DataFrame(result.get('chart_data', [])),
+        'Summary': _summary_frame(result.get('structured_summary', {}))
+    }
+    return _write_workbook_bytes(sheets), "credit_card_payoff.xlsx"
+
 def _export_rollover_to_excel_bytes(rollover_result: Dict[str, Any]) -> Tuple[bytes, str]:
     """FIX: Moved this function definition outside the AmortizationEngine class 
            but before the router, where it is called."""
@@ -635,23 +1450,11 @@ def _export_rollover_to_excel_bytes(rollover_result: Dict[str, Any]) -> Tuple[by
     df_eur_over_yearly = pd.DataFrame(_generate_yearly_schedule_from_normalized(eur_over)) if eur_over else pd.DataFrame()
     df_uk_base_yearly = pd.DataFrame(_generate_yearly_schedule_from_normalized(uk_base)) if uk_base else pd.DataFrame()
     df_uk_post_yearly = pd.DataFrame(_generate_yearly_schedule_from_normalized(uk_post)) if uk_post else pd.DataFrame()
-    max_month = 0
-    for lst in (eur_base, eur_over, uk_base, uk_post):
-        if lst: max_month = max(max_month, max(int(x.get('month', 0)) for x in lst))
-    comp_rows = []
-    for m in range(1, max_month + 1):
-        def find_balance(lst):
-            if not lst: return None
-            for x in lst:
-                if int(x.get('month', x.get('Month', 0))) == m: return float(x.get('balance', x.get('Balance', 0.0)))
-            return None
-        comp_rows.append({
-            'month': m, 'eur_baseline_balance': find_balance(eur_base),
-            'eur_overpay_balance': find_balance(eur_over),
-            'uk_baseline_balance': find_balance(uk_base),
-            'uk_post_roll_balance': find_balance(uk_post)
-        })
-    df_comp = pd.DataFrame(comp_rows)
+    months, balances = merge_balance_series({
+        'eur_baseline_balance': eur_base, 'eur_overpay_balance': eur_over,
+        'uk_baseline_balance': uk_base, 'uk_post_roll_balance': uk_post
+    })
+    df_comp = pd.DataFrame(dict({'month': months}, **balances)) if months else pd.DataFrame()
     summary_keys = [
         'eur_payoff_time_years','eur_payoff_time_months','eur_freed_payment','gbp_freed_payment',
         'conversion_rate','eur_baseline_interest','eur_overpay_interest','eur_interest_saved',
@@ -675,22 +1478,7 @@ def _export_rollover_to_excel_bytes(rollover_result: Dict[str, Any]) -> Tuple[by
         df_chart.to_excel(writer, sheet_name='Chart_Data', index=False)
         df_summary.to_excel(writer, sheet_name='Summary', index=False)
         workbook = writer.book
-        header_fmt = workbook.add_format({'bold': True, 'bg_color': '#DCE6F1', 'border':1})
-        currency_fmt = workbook.add_format({'num_format': '£#,##0.00', 'border':1})
-        int_fmt = workbook.add_format({'num_format': '0', 'border':1})
-        default_fmt = workbook.add_format({'border':1})
-        def format_sheet(sheet_name, df):
-            worksheet = writer.sheets[sheet_name]
-            worksheet.set_row(0, None, header_fmt)
-            if df.empty: return
-            for i, col in enumerate(df.columns):
-                width = max(12, min(40, len(str(col)) + 2))
-                if any(x in str(col).lower() for x in ('balance','payment','principal','interest','fees','amount','total')):
-                    worksheet.set_column(i, i, width, currency_fmt)
-                elif 'month' in str(col).lower() or 'year' in str(col).lower():
-                    worksheet.set_column(i, i, width, int_fmt)
-                else:
-                    worksheet.set_column(i, i, width, default_fmt)
+        formats = _excel_formats(workbook)
         sheets_and_dfs = {
             'EUR_Baseline_Monthly': df_eur_base, 'EUR_Overpay_Monthly': df_eur_over,
             'EUR_Baseline_Yearly': df_eur_base_yearly, 'EUR_Overpay_Yearly': df_eur_over_yearly,
@@ -699,7 +1487,7 @@ def _export_rollover_to_excel_bytes(rollover_result: Dict[str, Any]) -> Tuple[by
             'Comparison': df_comp, 'Chart_Data': df_chart, 'Summary': df_summary
         }
         for sn, df in sheets_and_dfs.items():
-            format_sheet(sn, df)
+            _format_excel_sheet(writer, formats, sn, df)
         if not df_chart.empty and 'month' in df_chart.columns:
             worksheet_chart = writer.sheets['Chart_Data']
             rows = len(df_chart)
@@ -738,10 +1526,70 @@ def _export_rollover_to_excel_bytes(rollover_result: Dict[str, Any]) -> Tuple[by
     return buffer.read(), "rollover_analysis.xlsx"
 
 
+# Export route -> (engine calculation, workbook builder)
+_EXPORTERS = {
+    "export_rollover": ("calculate_rollover_summary", _export_rollover_to_excel_bytes),
+    "export_refinance": ("calculate_refinance_summary", _export_refinance_to_excel_bytes),
+    "export_revolving": ("calculate_revolving_debt", _export_revolving_to_excel_bytes),
+    "export_overpayment": ("calculate_overpayment_summary", _export_overpayment_to_excel_bytes),
+}
+
+def route_for(script: str) -> Optional[str]:
+    """Returns the route key process_request would use for a free-text script name."""
+    return _resolve_route(" ".join((script or "").lower().split()))
+
+def export_route_for(script: str) -> Optional[str]:
+    """Returns the export route key for a free-text script name, or None if it is not an export."""
+    route = route_for(script)
+    return route if route in _EXPORTERS else None
+
+def build_export(route: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Runs the calculation behind an export route and builds its workbook.
+    Returns {'excel_bytes', 'filename'} or {'error'}.
+    """
+    method_name, exporter = _EXPORTERS[route]
+    res = getattr(AmortizationEngine(), method_name)(data)
+    if 'error' in res:
+        return res
+    excel_bytes, filename = exporter(res)
+    return {'excel_bytes': excel_bytes, 'filename': filename}
+
+
 # -----------------------
 # Router
 # -----------------------
 
+def _resolve_route(script_lower: str) -> Optional[str]:
+    """Maps a normalized free-text script name to a route key (None if unknown)."""
+    if "savings growth" in script_lower or "future value" in script_lower:
+        return "savings"
+    if "export" in script_lower:
+        if "rollover" in script_lower:
+            return "export_rollover"
+        if "refinance" in script_lower:
+            return "export_refinance"
+        if "credit card" in script_lower or "revolving" in script_lower:
+            return "export_revolving"
+        if any(k in script_lower for k in ("mortgage", "overpayment", "other loan")):
+            return "export_overpayment"
+    if "rollover" in script_lower:
+        return "rollover"
+    if "refinance" in script_lower:
+        return "refinance"
+    if "credit card" in script_lower or "revolving" in script_lower:
+        return "revolving"
+    if "optimi" in script_lower or "budget allocation" in script_lower:
+        return "optimizer"
+    if any(k in script_lower for k in ("calculator", "required overpayment", "run_calculator", "target",
+                                       "overpayment calculator", "overpayment simulation", "overpayment simulation logic")):
+        return "calculator"
+    if any(k in script_lower for k in ("mortgage simulation", "eu mortgage", "uk mortgage", "overpayment summary", "overpayment", "other loan")):
+        return "overpayment"
+    if "mortgage" in script_lower:
+        return "overpayment"
+    return None
+
 def process_request(script: str, data: Dict[str, Any]) -> str:
     """
     Robust router for integration. Accepts a script name (free text) and a data dict.
@@ -761,36 +1609,35 @@ def process_request(script: str, data: Dict[str, Any]) -> str:
         print(f"PROCESS_REQUEST: data keys = {list(data.keys()) if isinstance(data, dict) else type(data)}")
         print("=" * 60)
 
+        route = _resolve_route(script_lower)
+
         # --- SAVINGS GROWTH ROUTE ---
-        if "savings growth" in script_lower or "future value" in script_lower:
+        if route == "savings":
             result = engine.calculate_savings_growth(data)
         # ----------------------------
         
-        elif "export" in script_lower and "rollover" in script_lower:
-            res = engine.calculate_rollover_summary(data)
+        elif route in _EXPORTERS:
+            res = build_export(route, data)
             if 'error' in res: result = res
             else:
-                # FIX: Function is now correctly defined above
-                excel_bytes, filename = _export_rollover_to_excel_bytes(res) 
-                result = {'excel_base64': base64.b64encode(excel_bytes).decode('ascii'), 'filename': filename}
+                result = {'excel_base64': base64.b64encode(res['excel_bytes']).decode('ascii'), 'filename': res['filename']}
         
-        elif "rollover" in script_lower:
+        elif route == "rollover":
             result = engine.calculate_rollover_summary(data)
         
-        elif "refinance" in script_lower:
+        elif route == "refinance":
             result = engine.calculate_refinance_summary(data)
         
-        elif "credit card" in script_lower or "revolving" in script_lower:
+        elif route == "revolving":
             result = engine.calculate_revolving_debt(data)
             
-        elif any(k in script_lower for k in ("calculator", "required overpayment", "run_calculator", "target",
-                                             "overpayment calculator", "overpayment simulation", "overpayment simulation logic")):
+        elif route == "optimizer":
+            result = engine.optimize_overpayment_allocation(data)
+
+        elif route == "calculator":
             result = engine.run_calculator(data)
             
-        elif any(k in script_lower for k in ("mortgage simulation", "eu mortgage", "uk mortgage", "overpayment summary", "overpayment", "other loan")):
-            result = engine.calculate_overpayment_summary(data)
-            
-        elif "mortgage" in script_lower:
+        elif route == "overpayment":
             result = engine.calculate_overpayment_summary(data)
             
         else:
@@ -799,4 +1646,31 @@ def process_request(script: str, data: Dict[str, Any]) -> str:
     except Exception as e:
         result = {"error": f"Python engine error: {str(e)}", "received_script": script, "received_data": data}
 
-    return json.dumps(result)
\ No newline at end of file
+    return json.dumps(result)
+
+def process_request_stream(script: str, data: Dict[str, Any]) -> Iterator[str]:
+    """
+    NDJSON variant of process_request. Yields one JSON document per line.
+    Schedule routes stream 'monthly' row chunks, 'yearly' rows and 'chart' points as they
+    are produced, plus a 'summary' record; other routes yield a single 'result' record.
+    """
+    engine = AmortizationEngine()
+    script_raw = script or ""
+    script_lower = " ".join(script_raw.lower().split())
+    print(f"PROCESS_REQUEST_STREAM: script_normalized = '{script_lower}'")
+
+    try:
+        route = _resolve_route(script_lower)
+        chunk_size = int(data.get('stream_chunk', 12)) if isinstance(data, dict) else 12
+        if route == "overpayment":
+            records = engine.stream_overpayment_summary(data, chunk_size)
+        elif route == "calculator":
+            records = engine.stream_calculator(data, chunk_size)
+        elif route == "revolving":
+            records = engine.stream_revolving_debt(data, chunk_size)
+        else:
+            records = iter([{"type": "result", "result": json.loads(process_request(script, data))}])
+        for record in records:
+            yield json.dumps(record) + "\n"
+    except Exception as e:
+        yield json.dumps({"type": "error", "error": f"Python engine error: {str(e)}"}) + "\n"
@@ -1,12 +1,16 @@
 # scripts/api_server.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 import json
+import math
 import sys
 import os
 
 # --- Import Financial Engine ---
 try:
-    from amortization_engine import process_request
+    from amortization_engine import process_request, process_request_stream
+    from export_jobs import ExportJobQueue
+    from request_profiler import is_authorized, profile_call, store_report
+    from scenario_store import ScenarioStore
 except ImportError as e:
     print("="*50)
     print("FATAL ERROR: Could not import 'amortization_engine.py'.")
@@ -24,11 +28,30 @@ except Exception as e:
 app = Flask(__name__)
 HOST = '0.0.0.0' 
 PORT = 5000
+# Admin-only routes (profiling, scenario compaction) take PROFILE_ADMIN_TOKEN in this header
+ADMIN_TOKEN_HEADER = 'X-Admin-Token'
+
+# Background Excel exports (see export_jobs.py). /tmp survives worker recycling on Cloud Run.
+export_queue = ExportJobQueue(
+    os.environ.get('EXPORT_SPOOL_DIR', '/tmp/projectm_exports'),
+    max_workers=int(os.environ.get('EXPORT_WORKERS', 2))
+)
+MAX_EXPORT_WAIT_S = 25.0
+
+# Saved scenarios (see scenario_store.py), evicted least-recently-used past the size limit.
+scenario_store = ScenarioStore(
+    os.environ.get('SCENARIO_STORE_DIR', '/tmp/projectm_scenarios'),
+    max_bytes=int(float(os.environ.get('SCENARIO_STORE_MAX_MB', 256)) * 1024 * 1024)
+)
 
 @app.route('/calculate', methods=['POST'])
 def calculate():
     """
     Handles all mortgage calculation requests from the Flutter app.
+    Send "stream": true (or Accept: application/x-ndjson) to receive the
+    schedule as newline-delimited JSON records while it is being computed.
+    Admins can send "profile": true (or {"interval_ms": .., "allocations": ..})
+    with an X-Admin-Token header to get a '_profile' report back.
     """
     if not request.is_json:
         return jsonify({"error": "Invalid Content-Type. Must be application/json."}), 400
@@ -50,6 +73,28 @@ def calculate():
         print("="*40)
         # --- END OF DEBUGGING LINES ---
 
+        # --- OPT-IN PROFILING (admin only) ---
+        if data.get('profile'):
+            if not is_authorized(request.headers.get(ADMIN_TOKEN_HEADER)):
+                return jsonify({"error": "Profiling is not enabled for this request."}), 403
+            opts = data['profile'] if isinstance(data['profile'], dict) else {}
+            response_data, report = profile_call(
+                process_request, script, data_dict,
+                interval_ms=float(opts.get('interval_ms', 1.0)),
+                allocations=bool(opts.get('allocations', True))
+            )
+            response_dict = json.loads(response_data)
+            output_dir = os.environ.get('PROFILE_OUTPUT_DIR')
+            response_dict['_profile'] = store_report(report, script, output_dir) if output_dir else report
+            return jsonify(response_dict)
+
+        # --- STREAMED NDJSON MODE ---
+        if data.get('stream') or 'application/x-ndjson' in request.headers.get('Accept', ''):
+            return Response(
+                stream_with_context(process_request_stream(script, data_dict)),
+                mimetype='application/x-ndjson'
+            )
+
         # We pass the DICTIONARY directly to process_request
         response_data = process_request(script, data_dict) 
         
@@ -63,6 +108,98 @@ def calculate():
             "error": f"Python Server Calculation Error: {str(e)}",
         }), 500
 
+@app.route('/exports', methods=['POST'])
+def submit_export():
+    """
+    Queues an Excel export. Body is the same {script, data} as /calculate, with an
+    export script such as "Export refinance to excel". Returns the job id to poll.
+    """
+    if not request.is_json:
+        return jsonify({"error": "Invalid Content-Type. Must be application/json."}), 400
+
+    try:
+        data = request.json
+        job = export_queue.submit(data.get('script', ''), data.get('data', {}))
+        if 'error' in job:
+            return jsonify(job), 400
+        return jsonify(job), 202
+    except Exception as e:
+        print(f"Export submit error: {e}")
+        return jsonify({"error": f"Python Server Export Error: {str(e)}"}), 500
+
+@app.route('/exports/<job_id>', methods=['GET'])
+def export_status(job_id):
+    """Job status. Pass ?wait=<seconds> to long-poll until the job finishes."""
+    try:
+        wait_s = float(request.args.get('wait', 0) or 0)
+    except ValueError:
+        wait_s = math.nan
+    if not math.isfinite(wait_s):
+        return jsonify({"error": "'wait' must be a number of seconds."}), 400
+    wait_s = min(MAX_EXPORT_WAIT_S, wait_s)
+    job = export_queue.wait(job_id, wait_s) if wait_s > 0 else export_queue.status(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown export job."}), 404
+    return jsonify(job)
+
+@app.route('/exports/<job_id>/download', methods=['GET'])
+def export_download(job_id):
+    job = export_queue.status(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown export job."}), 404
+    path = export_queue.result_path(job_id)
+    if path is None:
+        return jsonify(job), 409
+    return send_file(
+        path, as_attachment=True, download_name=job.get('filename', 'export.xlsx'),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+@app.route('/scenarios', methods=['POST'])
+def save_scenario():
+    """
+    Computes (or reuses) the result for {script, data} and keeps it in the scenario store.
+    Returns the scenario key alongside the result; 'cached' says whether it was reused.
+    """
+    if not request.is_json:
+        return jsonify({"error": "Invalid Content-Type. Must be application/json."}), 400
+
+    try:
+        data = request.json
+        key, result, cached = scenario_store.get_or_compute(
+            data.get('script', ''), data.get('data', {}),
+            lambda script, data_dict: json.loads(process_request(script, data_dict))
+        )
+        return jsonify({"scenario_key": key, "cached": cached, "result": result})
+    except Exception as e:
+        print(f"Scenario store error: {e}")
+        return jsonify({"error": f"Python Server Scenario Error: {str(e)}"}), 500
+
+@app.route('/scenarios/<key>', methods=['GET'])
+def load_scenario(key):
+    """
+    Saved result. Optional ?from_year=5&to_year=10 limits month/year tables to those years,
+    and ?tables=monthly_schedule,yearly_schedule picks which parts to return.
+    """
+    try:
+        from_year = request.args.get('from_year', type=int)
+        to_year = request.args.get('to_year', type=int)
+        tables = [t for t in request.args.get('tables', '').split(',') if t] or None
+        result = scenario_store.load(key, from_year=from_year, to_year=to_year, tables=tables)
+        if result is None:
+            return jsonify({"error": "Unknown scenario."}), 404
+        return jsonify({"scenario_key": key, "result": result})
+    except Exception as e:
+        print(f"Scenario store error: {e}")
+        return jsonify({"error": f"Python Server Scenario Error: {str(e)}"}), 500
+
+@app.route('/scenarios/compact', methods=['POST'])
+def compact_scenarios():
+    """Admin only (X-Admin-Token, as for profiling): eviction plus a VACUUM."""
+    if not is_authorized(request.headers.get(ADMIN_TOKEN_HEADER)):
+        return jsonify({"error": "Not authorized."}), 403
+    return jsonify({**scenario_store.compact(), **scenario_store.stats()})
+
 #
 # The 'if __name__ == "__main__":' block has been removed
 # as Gunicorn (in the Dockerfile) will run the 'app' variable directly.
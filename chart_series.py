@@ -0,0 +1,101 @@
+# chart_series.py
+# Balance-series helpers for charts and comparison sheets: a one-pass merge of any
+# number of month-indexed series, and largest-triangle-three-buckets (LTTB)
+# downsampling that keeps the chosen anchor months (payoffs, rate changes) exact.
+
+import heapq
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+
+def _month_balance_stream(rows: Iterable[Dict[str, Any]], idx: int) -> Iterator[Tuple[int, int, float]]:
+    for r in rows:
+        yield int(r.get('month', r.get('Month', 0))), idx, float(r.get('balance', r.get('Balance', 0.0)))
+
+
+def merge_balance_series(series: Dict[str, Iterable[Dict[str, Any]]]) -> Tuple[List[int], Dict[str, List[Optional[float]]]]:
+    """
+    Merges month-sorted schedules (capitalized or normalized rows) into one month axis.
+    Returns (months, {name: balances}) with None where a series has no row for that month.
+    """
+    names = list(series)
+    months: List[int] = []
+    columns: Dict[str, List[Optional[float]]] = {name: [] for name in names}
+    streams = [_month_balance_stream(rows, i) for i, rows in enumerate(series.values())]
+    for month, idx, balance in heapq.merge(*streams):
+        if not months or months[-1] != month:
+            months.append(month)
+            for name in names:
+                columns[name].append(None)
+        columns[names[idx]][-1] = balance
+    return months, columns
+
+
+def _lttb_segment(x: np.ndarray, ys: np.ndarray, threshold: int) -> List[int]:
+    """Classic LTTB on one segment; `ys` is (series, points) and triangle areas are summed across series."""
+    n = len(x)
+    if threshold >= n:
+        return list(range(n))
+    if threshold < 3:
+        return [0, n - 1]
+    picked = [0]
+    bucket = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket) + 1
+        stop = int((i + 1) * bucket) + 1
+        nxt_start, nxt_stop = stop, min(int((i + 2) * bucket) + 1, n)
+        if nxt_start >= nxt_stop:
+            nxt_start, nxt_stop = n - 1, n
+        avg_x = x[nxt_start:nxt_stop].mean()
+        avg_y = ys[:, nxt_start:nxt_stop].mean(axis=1, keepdims=True)
+        areas = np.abs(
+            (x[a] - avg_x) * (ys[:, start:stop] - ys[:, a:a + 1])
+            - (x[a] - x[start:stop]) * (avg_y - ys[:, a:a + 1])
+        ).sum(axis=0)
+        a = start + int(np.argmax(areas))
+        picked.append(a)
+    picked.append(n - 1)
+    return picked
+
+
+def lttb_indices(x: Sequence[float], ys: Sequence[Sequence[float]], max_points: int,
+                 keep: Iterable[int] = ()) -> List[int]:
+    """
+    Picks at most max(max_points, anchors) indices. First, last and `keep` indices are
+    always included; the remaining budget is shared between the segments between anchors
+    in proportion to their length and filled by LTTB within each segment.
+    """
+    n = len(x)
+    if n == 0:
+        return []
+    anchors = sorted({0, n - 1} | {int(k) for k in keep if 0 <= int(k) < n})
+    if max_points >= n:
+        return list(range(n))
+    xa = np.asarray(x, dtype=float)
+    ya = np.asarray(ys, dtype=float).reshape(len(ys), n)
+
+    interior_total = sum(max(0, e - s - 1) for s, e in zip(anchors, anchors[1:]))
+    spare = max(0, int(max_points) - len(anchors))
+    picked: Set[int] = set(anchors)
+    for s, e in zip(anchors, anchors[1:]):
+        interior = e - s - 1
+        if interior <= 0 or not interior_total:
+            continue
+        share = int(spare * interior / interior_total)
+        if share <= 0:
+            continue
+        seg = _lttb_segment(xa[s:e + 1], ya[:, s:e + 1], share + 2)
+        picked.update(s + i for i in seg)
+    return sorted(picked)
+
+
+def downsample_series(months: List[int], columns: Dict[str, List[float]], max_points: int,
+                      keep_months: Iterable[int] = ()) -> List[Dict[str, Any]]:
+    """Chart rows ({'month', <series>...}) reduced to about `max_points`, keeping `keep_months` exact."""
+    position = {m: i for i, m in enumerate(months)}
+    keep = [position[m] for m in keep_months if m in position]
+    names = list(columns)
+    idx = lttb_indices(months, [columns[n] for n in names], max_points, keep)
+    return [dict({"month": months[i]}, **{n: round(columns[n][i], 2) for n in names}) for i in idx]
@@ -0,0 +1,221 @@
+# export_jobs.py
+# Background Excel exports: a bounded worker pool backed by a SQLite job table
+# and a spool directory, so finished files survive gunicorn worker recycling.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, Optional
+
+from amortization_engine import build_export, export_route_for
+
+TERMINAL_STATES = ("done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    script TEXT NOT NULL,
+    route TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    filename TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+class ExportJobQueue:
+    """
+    Submits export jobs to a fixed-size thread pool and keeps their state in
+    `<spool_dir>/jobs.sqlite3`; workbooks are written to `<spool_dir>/<job_id>.xlsx`.
+    A running job renews its lease while it builds. Every `maintenance_s` (and on start)
+    expired jobs are purged and jobs whose lease ran out, e.g. because their worker died,
+    are queued again.
+    """
+
+    def __init__(self, spool_dir: str, max_workers: int = 2, retention_s: float = 24 * 3600, lease_s: float = 300,
+                 maintenance_s: Optional[float] = None):
+        self.spool_dir = spool_dir
+        self.db_path = os.path.join(spool_dir, "jobs.sqlite3")
+        self.retention_s = retention_s
+        self.lease_s = lease_s
+        self.maintenance_s = maintenance_s if maintenance_s is not None else min(60.0, lease_s / 2)
+        os.makedirs(spool_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="export-job")
+        self._done = threading.Condition()
+        # Jobs handed to this process's pool that have not started yet
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.maintain()
+        threading.Thread(target=self._maintenance_loop, name="export-maintenance", daemon=True).start()
+
+    # -----------------------
+    # Storage
+    # -----------------------
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _file_path(self, job_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.xlsx")
+
+    def _set_status(self, job_id: str, status: str, **fields) -> None:
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        sql = f"UPDATE jobs SET status = ?, updated = ?{', ' + cols if cols else ''} WHERE id = ?"
+        with self._connect() as conn:
+            conn.execute(sql, (status, time.time(), *fields.values(), job_id))
+        if status in TERMINAL_STATES:
+            with self._done:
+                self._done.notify_all()
+
+    def _enqueue(self, job_id: str) -> None:
+        with self._pending_lock:
+            if job_id in self._pending:
+                return
+            self._pending.add(job_id)
+        self._pool.submit(self._run, job_id)
+
+    def _recover(self) -> None:
+        """Re-queues jobs whose lease expired (their worker died) and queued jobs nobody picked up."""
+        stale = time.time() - self.lease_s
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running' AND updated < ?", (stale,))
+            ids = [r["id"] for r in conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created")]
+        for job_id in ids:
+            self._enqueue(job_id)
+
+    def maintain(self) -> None:
+        self.purge_expired()
+        self._recover()
+
+    def _maintenance_loop(self) -> None:
+        while not self._stop.wait(self.maintenance_s):
+            try:
+                self.maintain()
+            except Exception as e:
+                print(f"EXPORT_JOBS: maintenance failed: {e}")
+
+    def close(self) -> None:
+        self._stop.set()
+        self._pool.shutdown(wait=False)
+
+    def purge_expired(self) -> int:
+        """Deletes finished jobs (and their files) older than the retention window."""
+        cutoff = time.time() - self.retention_s
+        with self._connect() as conn:
+            ids = [r["id"] for r in conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND updated < ?", (cutoff,)
+            )]
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(i,) for i in ids])
+        for job_id in ids:
+            try:
+                os.remove(self._file_path(job_id))
+            except OSError:
+                pass
+        return len(ids)
+
+    # -----------------------
+    # Worker
+    # -----------------------
+    def _renew_lease(self, job_id: str, finished: threading.Event) -> None:
+        while not finished.wait(self.lease_s / 3):
+            with self._connect() as conn:
+                conn.execute("UPDATE jobs SET updated = ? WHERE id = ? AND status = 'running'", (time.time(), job_id))
+
+    def _run(self, job_id: str) -> None:
+        with self._pending_lock:
+            self._pending.discard(job_id)
+        # Claim the job atomically so two processes sharing the spool never build it twice
+        with self._connect() as conn:
+            claimed = conn.execute(
+                "UPDATE jobs SET status = 'running', updated = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            ).rowcount
+            row = conn.execute("SELECT route, payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not claimed or row is None:
+            return
+        finished = threading.Event()
+        threading.Thread(target=self._renew_lease, args=(job_id, finished), name="export-lease", daemon=True).start()
+        try:
+            res = build_export(row["route"], json.loads(row["payload"]))
+            if 'error' in res:
+                self._set_status(job_id, "failed", error=str(res['error']))
+                return
+            tmp_path = self._file_path(job_id) + ".part"
+            with open(tmp_path, "wb") as fh:
+                fh.write(res['excel_bytes'])
+            os.replace(tmp_path, self._file_path(job_id))
+            self._set_status(job_id, "done", filename=res['filename'])
+        except Exception as e:
+            self._set_status(job_id, "failed", error=f"Export job error: {str(e)}")
+        finally:
+            finished.set()
+
+    # -----------------------
+    # Public API
+    # -----------------------
+    def submit(self, script: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        route = export_route_for(script)
+        if route is None:
+            return {'error': f"Not an export script: '{script}'."}
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, script, route, payload, status, created, updated) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, script, route, json.dumps(data), now, now)
+            )
+        self._enqueue(job_id)
+        # Built from the inserted row: a fast worker may already have moved the job on
+        return {'job_id': job_id, 'script': script, 'status': 'queued', 'created': now, 'updated': now}
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, script, status, error, filename, created, updated FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        out = {
+            'job_id': row["id"], 'script': row["script"], 'status': row["status"],
+            'created': row["created"], 'updated': row["updated"]
+        }
+        if row["error"]: out['error'] = row["error"]
+        if row["filename"]: out['filename'] = row["filename"]
+        return out
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Long-poll: returns as soon as the job finishes, or its current status after `timeout` seconds."""
+        deadline = time.monotonic() + max(0.0, timeout)
+        while True:
+            st = self.status(job_id)
+            remaining = deadline - time.monotonic()
+            if st is None or st['status'] in TERMINAL_STATES or remaining <= 0:
+                return st
+            # Re-check the DB periodically too, in case another process runs the job
+            with self._done:
+                self._done.wait(min(0.5, remaining))
+
+    def result_path(self, job_id: str) -> Optional[str]:
+        st = self.status(job_id)
+        if st is None or st['status'] != "done":
+            return None
+        path = self._file_path(job_id)
+        return path if os.path.exists(path) else None
@@ -0,0 +1,154 @@
+# rate_curves.py
+# Tracker / variable rates as "index + margin" with caps and floors, fed by a locally
+# supplied index curve (forward SONIA/Euribor points). A curve is expanded once into a
+# per-month rate path with numpy, and the annuity factors for every reset month are
+# computed in the same batch, so the amortization loop only multiplies at each reset.
+
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+RATE_CURVES_DIR = os.environ.get(
+    'RATE_CURVES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rate_curves')
+)
+
+# Months simulated past the nominal term, matching the buffer in _iter_flexible
+_TERM_BUFFER_MONTHS = 20 * 12
+
+
+class CurvePlan(NamedTuple):
+    opening_rate_pct: float
+    path: np.ndarray                            # annual % for loan months 1..n (read-only)
+    resets: Dict[int, Tuple[float, float]]      # loan month -> (monthly rate, annuity factor) where the rate moves
+
+
+def _parse_points(raw: Any) -> List[Tuple[int, float]]:
+    """Accepts "month:rate,..." text, [[month, rate], ...] or {"month": rate}."""
+    if isinstance(raw, dict):
+        items = raw.items()
+    elif isinstance(raw, str):
+        items = [part.split(":", 1) for part in raw.split(",") if ":" in part]
+    else:
+        items = raw or []
+    points = {}
+    for m, r in items:
+        try:
+            points[int(str(m).strip())] = float(str(r).strip())
+        except ValueError:
+            continue
+    return sorted(points.items())
+
+
+def _load_local_curve(curve_id: str, required: bool = True) -> Dict[str, Any]:
+    """
+    Reads <RATE_CURVES_DIR>/<id>.json: {"points": [[month, rate], ...], "interpolation": ...} or a bare points list.
+    If not `required`, an id with no such file gives {} instead of an error.
+    """
+    if not re.fullmatch(r"[A-Za-z0-9_.-]+", curve_id or ""):
+        if not required:
+            return {}
+        raise ValueError(f"Invalid rate curve id '{curve_id}'.")
+    path = os.path.join(RATE_CURVES_DIR, f"{curve_id}.json")
+    try:
+        with open(path) as fh:
+            stored = json.load(fh)
+    except OSError:
+        if not required:
+            return {}
+        raise ValueError(f"Unknown rate curve '{curve_id}'.")
+    return stored if isinstance(stored, dict) else {"points": stored}
+
+
+def _opt_float(x: Any) -> Optional[float]:
+    return None if x is None or x == "" else float(x)
+
+
+def normalize_curve_spec(raw: Any) -> Optional[Dict[str, Any]]:
+    """
+    Validates a 'rate_curve' input into a canonical, hashable-friendly spec, or None if absent:
+      id            curve id; also names <RATE_CURVES_DIR>/<id>.json, required when no points are sent
+      index         index points in % (see _parse_points); merged over the local file's points
+      margin        added to the index (%)
+      cap / floor   bounds on index + margin (%)
+      reset_months  how often the rate follows the index (1 = tracker)
+      start_month   first month on the curve; before it the loan's own (or fixed_rate) applies
+      interpolation "step" (default) or "linear" between index points
+    """
+    if not raw:
+        return None
+    if not isinstance(raw, dict):
+        raise ValueError("rate_curve must be an object.")
+    curve_id = str(raw.get('id', 'inline'))
+    inline = _parse_points(raw.get('index'))
+    stored = _load_local_curve(curve_id, required=not inline)
+    points = dict(_parse_points(stored.get('points', stored.get('index'))))
+    points.update(inline)
+    if not points:
+        raise ValueError(f"Rate curve '{curve_id}' has no index points.")
+    interpolation = str(raw.get('interpolation', stored.get('interpolation', 'step'))).lower()
+    return {
+        'id': curve_id,
+        'points': tuple(sorted(points.items())),
+        'margin': float(raw.get('margin', 0.0)),
+        'cap': _opt_float(raw.get('cap')),
+        'floor': _opt_float(raw.get('floor')),
+        'reset_months': max(1, int(raw.get('reset_months', 1))),
+        'start_month': max(1, int(raw.get('start_month', 1))),
+        'fixed_rate': _opt_float(raw.get('fixed_rate')),
+        'interpolation': 'linear' if interpolation == 'linear' else 'step',
+    }
+
+
+def _expand(spec: Dict[str, Any], base_rate_pct: float, horizon: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Annual % for curve months 1..horizon (clipped index + margin, held between resets) and the reset mask."""
+    months = np.arange(1, horizon + 1)
+    pm = np.array([p[0] for p in spec['points']], dtype=float)
+    pr = np.array([p[1] for p in spec['points']], dtype=float)
+    if spec['interpolation'] == 'linear':
+        index = np.interp(months, pm, pr)
+    else:
+        index = pr[np.clip(np.searchsorted(pm, months, side='right') - 1, 0, None)]
+    rate = np.clip(
+        index + spec['margin'],
+        -np.inf if spec['floor'] is None else spec['floor'],
+        np.inf if spec['cap'] is None else spec['cap'],
+    )
+    start, every = spec['start_month'], spec['reset_months']
+    is_reset = (months >= start) & ((months - start) % every == 0)
+    last_reset = np.maximum.accumulate(np.where(is_reset, np.arange(horizon), -1))
+    fixed = base_rate_pct if spec['fixed_rate'] is None else spec['fixed_rate']
+    return np.where(last_reset >= 0, rate[np.maximum(last_reset, 0)], fixed), is_reset
+
+
+@lru_cache(maxsize=256)
+def _cached_plan(spec_items: Tuple, base_rate_pct: float, months_total: int, offset: int) -> CurvePlan:
+    spec = dict(spec_items)
+    n = months_total + _TERM_BUFFER_MONTHS
+    held, is_reset = _expand(spec, base_rate_pct, offset + n)
+    path = held[offset:offset + n].copy()
+    path.setflags(write=False)
+
+    # Batch annuity factors for every reset month after the first where the rate actually
+    # moves; like an explicit rate change, an unchanged rate does not recast the loan
+    loan_months = np.flatnonzero(is_reset[offset:offset + n]) + 1
+    loan_months = loan_months[loan_months >= 2]
+    loan_months = loan_months[path[loan_months - 1] != path[loan_months - 2]]
+    r = path[loan_months - 1] / 100.0 / 12.0
+    remaining = np.maximum(1, months_total - loan_months + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = (1.0 + r) ** remaining
+        factors = np.where(r > 0, r * growth / (growth - 1.0), 1.0 / remaining)
+    resets = {int(m): (float(rm), float(f)) for m, rm, f in zip(loan_months, r, factors)}
+    return CurvePlan(float(path[0]), path, resets)
+
+
+def curve_plan(spec: Dict[str, Any], base_rate_pct: float, months_total: int, offset: int = 0) -> CurvePlan:
+    """
+    Rate path and reset schedule for a loan of `months_total` months whose month 1 is
+    curve month offset + 1. Cached by curve id and parameters.
+    """
+    return _cached_plan(tuple(sorted(spec.items())), float(base_rate_pct), int(months_total), int(offset))
@@ -0,0 +1,227 @@
+# request_profiler.py
+# Opt-in profiling of a single /calculate request: sampled call stacks in collapsed
+# ("folded") format for flamegraph.pl / speedscope, plus time and allocation stats
+# for the engine's hot functions. Nothing here runs unless a request asks for it.
+
+import functools
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+import amortization_engine as engine_module
+
+# Functions whose calls get wall-time and tracemalloc figures. Generators are left out
+# on purpose: every resume/yield would count as a separate call. Only these functions are
+# instrumented (wrapped for the duration of a profile), so the rest of the request runs untouched.
+HOT_FUNCTIONS = (
+    "AmortizationEngine._amortize_flexible",
+    "AmortizationEngine._amortize_totals",
+    "AmortizationEngine._amortize_periodic",
+    "_normalize_monthly_history",
+    "_generate_yearly_schedule_from_capitalized",
+    "_generate_yearly_schedule_from_normalized",
+    "_generate_chart_data",
+    "_write_workbook_bytes",
+    "_export_rollover_to_excel_bytes",
+)
+
+_profile_lock = threading.Lock()
+
+
+_PROFILER_FILE = os.path.basename(__file__)
+
+
+def _hot_targets() -> List[Tuple[Any, str, str]]:
+    """(owner, attribute, name) for each resolvable HOT_FUNCTIONS entry."""
+    targets = []
+    for name in HOT_FUNCTIONS:
+        owner = engine_module
+        *path, attr = name.split(".")
+        try:
+            for part in path:
+                owner = getattr(owner, part)
+            getattr(owner, attr)
+        except AttributeError:
+            continue
+        targets.append((owner, attr, name))
+    return targets
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    """Admin routes (profiling, scenario compaction): PROFILE_ADMIN_TOKEN must be set and match the request's token."""
+    expected = os.environ.get('PROFILE_ADMIN_TOKEN', '')
+    return bool(expected) and hmac.compare_digest(expected, token or '')
+
+
+class _StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval and counts folded stacks."""
+
+    def __init__(self, thread_id: int, interval_s: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                if filename != _PROFILER_FILE:
+                    names.append(f"{filename}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class _HotFunctionTracer:
+    """
+    Wraps the hot functions while installed and, for calls made on the profiled thread,
+    times them or (with `allocations`) measures the tracemalloc net/peak bytes of each call.
+    Other threads call straight through. tracemalloc is process-wide, so allocations made
+    by other request threads at the same moment are included.
+    """
+
+    def __init__(self, thread_id: int, targets: List[Tuple[Any, str, str]], allocations: bool = False):
+        self.thread_id = thread_id
+        self.targets = targets
+        self.allocations = allocations
+        self.stack: List[List[Any]] = []
+        self.stats: Dict[str, Dict[str, float]] = {}
+        self._originals: List[Tuple[Any, str, Any]] = []
+
+    def _wrap(self, func: Callable, name: str) -> Callable:
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            if threading.get_ident() != self.thread_id:
+                return func(*args, **kwargs)
+            self._event("call", name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._event("return", name)
+        return timed
+
+    def install(self):
+        wrapped = {}
+        for owner, attr, name in self.targets:
+            original = owner.__dict__[attr]
+            wrapped[original] = self._wrap(original, name)
+            self._originals.append((owner, attr, original))
+            setattr(owner, attr, wrapped[original])
+        # Exporters are also reached through the route table
+        for route, (method, exporter) in list(engine_module._EXPORTERS.items()):
+            if exporter in wrapped:
+                self._originals.append((engine_module._EXPORTERS, route, (method, exporter)))
+                engine_module._EXPORTERS[route] = (method, wrapped[exporter])
+
+    def uninstall(self):
+        for owner, attr, original in reversed(self._originals):
+            if isinstance(owner, dict):
+                owner[attr] = original
+            else:
+                setattr(owner, attr, original)
+        self._originals = []
+
+    def _event(self, event: str, name: str):
+        current, peak = tracemalloc.get_traced_memory() if self.allocations else (0, 0)
+        for entry in self.stack:
+            entry[3] = max(entry[3], peak)
+        if event == "call":
+            if self.allocations:
+                tracemalloc.reset_peak()
+            self.stack.append([name, time.perf_counter(), current, current])
+        elif self.stack and self.stack[-1][0] == name:
+            _, t0, start_bytes, peak_bytes = self.stack.pop()
+            if self.allocations:
+                st = self.stats.setdefault(name, {'net_bytes': 0, 'peak_bytes': 0})
+                st['net_bytes'] += current - start_bytes
+                st['peak_bytes'] = max(st['peak_bytes'], peak_bytes - start_bytes)
+            else:
+                st = self.stats.setdefault(name, {'calls': 0, 'wall_ms': 0.0})
+                st['calls'] += 1
+                st['wall_ms'] += (time.perf_counter() - t0) * 1000.0
+
+    def report(self, memory: Optional["_HotFunctionTracer"] = None) -> Dict[str, Dict[str, float]]:
+        """Timings from this pass, merged with the byte counts of a separate allocation pass."""
+        return {
+            name: dict(st, wall_ms=round(st['wall_ms'], 3), **(memory.stats.get(name, {}) if memory else {}))
+            for name, st in sorted(self.stats.items(), key=lambda kv: -kv[1]['wall_ms'])
+        }
+
+
+def profile_call(func: Callable, *args, interval_ms: float = 1.0, allocations: bool = True) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Runs func(*args) in the calling thread under the stack sampler, with the hot functions
+    timed. tracemalloc slows every allocation, so if `allocations` is set func runs a second
+    time, unsampled, to measure the hot functions' bytes. Returns (the first run's result,
+    profile report). One profile at a time per process, since the switch interval,
+    tracemalloc and the hot-function wrappers are global.
+    """
+    interval_s = min(0.1, max(0.0005, float(interval_ms) / 1000.0))
+    thread_id = threading.get_ident()
+    targets = _hot_targets()
+    with _profile_lock:
+        old_switch = sys.getswitchinterval()
+        sys.setswitchinterval(min(old_switch, interval_s / 2))
+        timer = _HotFunctionTracer(thread_id, targets)
+        sampler = _StackSampler(thread_id, interval_s)
+        timer.install()
+        t0 = time.perf_counter()
+        sampler.start()
+        try:
+            result = func(*args)
+        finally:
+            wall_ms = (time.perf_counter() - t0) * 1000.0
+            sampler.stop()
+            timer.uninstall()
+            sys.setswitchinterval(old_switch)
+
+        memory = None
+        if allocations:
+            memory = _HotFunctionTracer(thread_id, targets, allocations=True)
+            started_tracemalloc = not tracemalloc.is_tracing()
+            if started_tracemalloc:
+                tracemalloc.start()
+            memory.install()
+            try:
+                func(*args)
+            finally:
+                memory.uninstall()
+                if started_tracemalloc:
+                    tracemalloc.stop()
+
+    report = {
+        'wall_ms': round(wall_ms, 3),
+        'interval_ms': round(interval_s * 1000.0, 3),
+        'samples': sum(sampler.stacks.values()),
+        'collapsed': "\n".join(f"{stack} {count}" for stack, count in sampler.stacks.most_common()),
+    }
+    report['hot_functions'] = timer.report(memory)
+    return result, report
+
+
+def store_report(report: Dict[str, Any], script: str, output_dir: str) -> Dict[str, Any]:
+    """Writes the collapsed stacks to `<output_dir>/<stamp>_<script>.folded`; returns the report minus the stacks."""
+    os.makedirs(output_dir, exist_ok=True)
+    slug = re.sub(r"[^a-z0-9]+", "_", (script or "request").lower()).strip("_")[:40] or "request"
+    path = os.path.join(output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{slug}.folded")
+    with open(path, "w") as fh:
+        fh.write(report['collapsed'] + "\n")
+    stored = {k: v for k, v in report.items() if k != 'collapsed'}
+    stored['collapsed_path'] = path
+    return stored
@@ -0,0 +1,275 @@
+# scenario_store.py
+# Server-side store for saved scenarios. Results are keyed by a hash of the canonical
+# inputs; schedule tables are kept as columnar .npy files that are memory-mapped on
+# read, so year-range slices only touch the rows they return.
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from amortization_engine import route_for
+from rate_curves import normalize_curve_spec
+
+# Bump when the engine's output for the same inputs changes, so old entries stop matching.
+STORE_VERSION = 2
+
+# Transport-only fields that do not change the computed result
+_IGNORED_INPUT_KEYS = ("stream_chunk",)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenarios (
+    key TEXT PRIMARY KEY,
+    script TEXT NOT NULL,
+    route TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+)
+"""
+
+
+def _resolve_curves(value: Any) -> Any:
+    """
+    Replaces every 'rate_curve' with its normalized spec, so a curve sent by id is keyed
+    by the points currently in RATE_CURVES_DIR and an updated curve file stops matching.
+    """
+    if isinstance(value, list):
+        return [_resolve_curves(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    out = {}
+    for k, v in value.items():
+        if k == 'rate_curve' and v:
+            try:
+                v = normalize_curve_spec(v)
+            except (TypeError, ValueError):
+                pass  # invalid curves fail in the engine, and error results are never stored
+        out[k] = _resolve_curves(v)
+    return out
+
+
+def scenario_key(script: str, data: Dict[str, Any]) -> str:
+    """Content hash of the route and canonical JSON of the inputs (with rate curves resolved)."""
+    canonical = _resolve_curves({k: v for k, v in (data or {}).items() if k not in _IGNORED_INPUT_KEYS})
+    blob = json.dumps(
+        {"v": STORE_VERSION, "route": route_for(script), "data": canonical},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+
+def _columnar_table(rows: Any) -> Optional[Tuple[np.ndarray, List[str], List[str]]]:
+    """Returns (structured array, columns, kinds) if `rows` is a uniform all-numeric table."""
+    if not isinstance(rows, list) or not rows or not all(isinstance(r, dict) for r in rows):
+        return None
+    columns = list(rows[0].keys())
+    if any(r.keys() != rows[0].keys() for r in rows):
+        return None
+    kinds = []
+    for col in columns:
+        values = [r[col] for r in rows]
+        if any(isinstance(v, bool) or not isinstance(v, (int, float)) for v in values):
+            return None
+        kinds.append("int" if all(isinstance(v, int) for v in values) else "float")
+    dtype = [(col, np.int64 if kind == "int" else np.float64) for col, kind in zip(columns, kinds)]
+    arr = np.array([tuple(r[c] for c in columns) for r in rows], dtype=dtype)
+    return arr, columns, kinds
+
+
+def _rows_from_array(arr: np.ndarray, columns: List[str], kinds: List[str]) -> List[Dict[str, Any]]:
+    casts = [int if kind == "int" else float for kind in kinds]
+    return [{c: cast(v) for c, cast, v in zip(columns, casts, rec)} for rec in arr.tolist()]
+
+
+def _year_window(arr: np.ndarray, columns: List[str], from_year: Optional[int], to_year: Optional[int]) -> np.ndarray:
+    """Zero-copy slice of a month- or year-indexed table (rows are sorted by that column)."""
+    if from_year is None and to_year is None:
+        return arr
+    if "month" in columns:
+        col, lo, hi = "month", ((from_year or 1) - 1) * 12 + 1, (to_year * 12 if to_year else None)
+    elif "year" in columns:
+        col, lo, hi = "year", (from_year or 0), to_year
+    else:
+        return arr
+    index = arr[col]
+    start = int(np.searchsorted(index, lo, side="left"))
+    stop = int(np.searchsorted(index, hi, side="right")) if hi is not None else len(arr)
+    return arr[start:stop]
+
+
+class ScenarioStore:
+    """
+    Layout: `<root>/index.sqlite3` plus one `<root>/<key>/` directory per scenario holding
+    `result.json` (everything non-tabular) and one `<table>.npy` per schedule table.
+    Least recently used scenarios are evicted once the store grows past `max_bytes`.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 256 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self.db_path = os.path.join(root, "index.sqlite3")
+        os.makedirs(root, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    # -----------------------
+    # Write
+    # -----------------------
+    def save(self, script: str, data: Dict[str, Any], result: Dict[str, Any]) -> str:
+        key = scenario_key(script, data)
+        final_dir = self._dir(key)
+        tmp_dir = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+
+        manifest: Dict[str, Any] = {"order": list(result.keys()), "json": {}, "tables": {}}
+        for name, value in result.items():
+            table = _columnar_table(value)
+            if table is None:
+                manifest["json"][name] = value
+                continue
+            arr, columns, kinds = table
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), arr, allow_pickle=False)
+            manifest["tables"][name] = {"columns": columns, "kinds": kinds, "rows": len(arr)}
+        with open(os.path.join(tmp_dir, "result.json"), "w") as fh:
+            json.dump(manifest, fh)
+
+        size = sum(os.path.getsize(os.path.join(tmp_dir, f)) for f in os.listdir(tmp_dir))
+        try:
+            os.rename(tmp_dir, final_dir)
+        except OSError:
+            # Same inputs already stored (possibly by another worker): keep that copy
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO scenarios (key, script, route, size_bytes, created, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, script, route_for(script) or "", size, now, now)
+            )
+        self.evict()
+        return key
+
+    # -----------------------
+    # Read
+    # -----------------------
+    def load(self, key: str, from_year: Optional[int] = None, to_year: Optional[int] = None,
+             tables: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Returns the saved result, optionally restricted to `tables` and to the rows of
+        years from_year..to_year (inclusive) in month/year indexed tables.
+        """
+        if not re.fullmatch(r"[0-9a-f]{32}", key or ""):
+            return None
+        manifest_path = os.path.join(self._dir(key), "result.json")
+        try:
+            with open(manifest_path) as fh:
+                manifest = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        with self._connect() as conn:
+            conn.execute("UPDATE scenarios SET hits = hits + 1, last_access = ? WHERE key = ?", (time.time(), key))
+
+        out: Dict[str, Any] = {}
+        for name in manifest["order"]:
+            if tables and name not in tables:
+                continue
+            if name in manifest["json"]:
+                out[name] = manifest["json"][name]
+                continue
+            meta = manifest["tables"][name]
+            arr = np.load(os.path.join(self._dir(key), f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+            window = _year_window(arr, meta["columns"], from_year, to_year)
+            out[name] = _rows_from_array(window, meta["columns"], meta["kinds"])
+        return out
+
+    def get_or_compute(self, script: str, data: Dict[str, Any],
+                       compute: Callable[[str, Dict[str, Any]], Dict[str, Any]]) -> Tuple[str, Dict[str, Any], bool]:
+        """Returns (key, result, cached). Error results are passed through and never stored."""
+        key = scenario_key(script, data)
+        cached = self.load(key)
+        if cached is not None:
+            return key, cached, True
+        result = compute(script, data)
+        if 'error' in result:
+            return key, result, False
+        self.save(script, data, result)
+        return key, result, False
+
+    # -----------------------
+    # Maintenance
+    # -----------------------
+    def delete(self, key: str) -> None:
+        shutil.rmtree(self._dir(key), ignore_errors=True)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM scenarios WHERE key = ?", (key,))
+
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """Drops least recently used scenarios until the store fits in `max_bytes`."""
+        limit = self.max_bytes if max_bytes is None else int(max_bytes)
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM scenarios").fetchone()[0]
+            victims = []
+            if total > limit:
+                for row in conn.execute("SELECT key, size_bytes FROM scenarios ORDER BY last_access"):
+                    if total <= limit:
+                        break
+                    victims.append(row["key"])
+                    total -= row["size_bytes"]
+        for key in victims:
+            self.delete(key)
+        return len(victims)
+
+    def compact(self) -> Dict[str, int]:
+        """Removes orphaned directories and index rows, applies the size limit and vacuums the index."""
+        with self._connect() as conn:
+            indexed = {r["key"] for r in conn.execute("SELECT key FROM scenarios")}
+        # In-flight writes live in .tmp-* dirs; only sweep those left behind by a crash
+        crash_cutoff = time.time() - 3600
+        on_disk = {
+            d for d in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, d))
+            and (not d.startswith(".tmp-") or os.path.getmtime(os.path.join(self.root, d)) < crash_cutoff)
+        }
+
+        orphan_dirs = on_disk - indexed
+        for d in orphan_dirs:
+            shutil.rmtree(os.path.join(self.root, d), ignore_errors=True)
+        missing = indexed - on_disk
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM scenarios WHERE key = ?", [(k,) for k in missing])
+        evicted = self.evict()
+
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        return {'orphan_dirs_removed': len(orphan_dirs), 'stale_entries_removed': len(missing), 'evicted': evicted}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM scenarios").fetchone()
+        return {'scenarios': count, 'size_bytes': total, 'max_bytes': self.max_bytes}